@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Benchmark
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+from argparse import ArgumentParser
+import json
+from pathlib import Path
+from random import choice, randint, uniform
+import re
+import sys
+import time
+import zlib
+
+# Third party library imports
+from tabulate import tabulate
+
+# Own library
+from lib import cache, common, reporting
+
+# Debug
+# from pdb import set_trace as st
+
+VERSION = '1.0.0'
+
+def gen_cours_body(index):
+    """
+    Returns a synthetic get_cours response, shaped like the upstream one
+    """
+    fields = {}
+    for field in reporting.FIELDS:
+        name, _, attribute = field.partition(':')
+        if attribute:
+            fields.setdefault(name, {})[attribute] = f'{name.lower()} {randint(1, 50)}'
+        elif name in ('DISPLAY_NAME', 'COMPFULLNAME'):
+            fields[name] = {'v': f'Company {index} {choice(["SA", "SE", "NV", "PLC"])}'}
+        elif name in ('ISIN', 'M_SYMB', 'M_CUR', 'MIC', 'EVENT3', 'SRD'):
+            fields[name] = {'v': f'{name[:2]}{index:010d}'}
+        else:
+            fields[name] = {'v': round(uniform(-100, 1000), randint(0, 4))}
+    return json.dumps({'fields': fields})
+
+def clean_data_reference(raw_data, json_load=True):
+    """
+    Returns cleaned data, with the chained replacements of lib.common before 2024
+    """
+    # pylint: disable=W1401
+    cleaned_data = re.sub('<[a-zA-Z0-9\.\\\/\"\'=\ ]+>', '', raw_data)
+    cleaned_data = cleaned_data.\
+                      replace(';', '').\
+                      replace('\\n', '').\
+                      replace('\\t', '').\
+                      replace('\n', '').\
+                      replace('\t', '').\
+                      replace('&euro', '').\
+                      replace('&#039', "'").\
+                      replace('\xa0', '')
+    if json_load:
+        cleaned_data = json.loads(cleaned_data)
+    return cleaned_data
+
+def gen_dirty_body(index):
+    """
+    Returns a synthetic get_cours response with html and escaped sequences to scrub
+    """
+    body = json.loads(gen_cours_body(index))
+    body['fields']['DISPLAY_NAME']['v'] = f'L&#039;Entreprise {index}\xa0<b>SA</b>\n'
+    body['fields']['SEC']['description'] = 'Commerce de d\xe9tail;\tgrands magasins'
+    return json.dumps(body, ensure_ascii=False)
+
+def load_bodies(inputs, count):
+    """
+    Returns the captured payloads of the inputs, or synthetic ones
+    """
+    if not inputs:
+        return [gen_cours_body(index) for index in range(count)]
+    bodies = []
+    for input_path in inputs:
+        for path in sorted(Path(input_path).glob('*')) if Path(input_path).is_dir() else [Path(input_path)]:
+            bodies.append(path.read_text(encoding='utf-8'))
+    return bodies
+
+def timeit(function, values, rounds):
+    """
+    Returns the mean duration in microseconds of function over the values
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for value in values:
+            function(value)
+    return 1e6 * (time.perf_counter() - start) / (rounds * len(values))
+
+def bench_clean_data(bodies, rounds):
+    """
+    Prints the duration of clean_data against the reference one, checking identical output
+    """
+    dirty = [gen_dirty_body(index) for index in range(len(bodies))]
+    rows = []
+    for name, payloads in (('clean', bodies), ('dirty', dirty)):
+        for payload in payloads:
+            if common.clean_data(payload) != clean_data_reference(payload):
+                print(f'Different output on a {name} payload')
+                sys.exit(1)
+        for json_load in (False, True):
+            reference = timeit(lambda body, load=json_load: clean_data_reference(body, load),
+                payloads, rounds)
+            current = timeit(lambda body, load=json_load: common.clean_data(body, load),
+                payloads, rounds)
+            rows.append([name, 'scrub + json' if json_load else 'scrub',
+                round(reference, 1), round(current, 1), round(reference / current, 2)])
+    print(f'{len(bodies)} payloads, identical output')
+    print(tabulate(rows, ['Payloads', 'Step', 'Reference (µs)', 'clean_data (µs)', 'Speedup']))
+
+def bench_compression(bodies, rounds):
+    """
+    Prints the disk size and read latency of the cache payloads per compression level
+    """
+    raw_size = sum(len(body.encode('utf-8')) for body in bodies)
+    rows = []
+    plain = [body.encode('utf-8') for body in bodies]
+    rows.append(['none', raw_size, 100.0,
+        round(timeit(cache.decode_content, plain, rounds), 1),
+        round(timeit(lambda body: body.encode('utf-8'), bodies, rounds), 1)])
+    for level in (1, 6, 9):
+        compressed = [cache.COMPRESSED_MARKER + zlib.compress(body, level) for body in plain]
+        size = sum(len(payload) for payload in compressed)
+        rows.append([f'zlib {level}', size, round(100 * size / raw_size, 1),
+            round(timeit(cache.decode_content, compressed, rounds), 1),
+            round(timeit(lambda body, lvl=level: zlib.compress(body.encode('utf-8'), lvl),
+                bodies, rounds), 1)])
+    print(f'{len(bodies)} payloads, {raw_size} bytes')
+    print(tabulate(rows, ['Format', 'Size (bytes)', 'Size (%)', 'Read (µs)', 'Write (µs)']))
+
+if __name__ == '__main__':
+
+    PARSER = ArgumentParser()
+
+    SUBPARSERS = PARSER.add_subparsers(help='commands')
+
+    PARSER.add_argument('--version', action='version', version=VERSION)
+
+    # COMPRESSION Arguments
+    COMPRESSION_PARSER = SUBPARSERS.add_parser('compression',\
+        help='Cache compression benchmark')
+    COMPRESSION_PARSER.add_argument('inputs', action='store', nargs='*',\
+        help='Captured payload files or directories (=synthetic get_cours bodies)')
+    COMPRESSION_PARSER.add_argument('-c', '--count', action='store', type=int,\
+        help='Number of synthetic payloads', default=200)
+    COMPRESSION_PARSER.add_argument('-r', '--rounds', action='store', type=int,\
+        help='Number of rounds', default=20)
+
+    # CLEAN_DATA Arguments
+    CLEAN_DATA_PARSER = SUBPARSERS.add_parser('clean_data',\
+        help='common.clean_data benchmark')
+    CLEAN_DATA_PARSER.add_argument('inputs', action='store', nargs='*',\
+        help='Captured payload files or directories (=synthetic get_cours bodies)')
+    CLEAN_DATA_PARSER.add_argument('-c', '--count', action='store', type=int,\
+        help='Number of synthetic payloads', default=200)
+    CLEAN_DATA_PARSER.add_argument('-r', '--rounds', action='store', type=int,\
+        help='Number of rounds', default=20)
+
+    ARGS = PARSER.parse_args()
+
+    if len(sys.argv) == 1:
+        PARSER.print_help()
+        sys.exit(1)
+
+    if sys.argv[1] == 'compression':
+        bench_compression(load_bodies(ARGS.inputs, ARGS.count), ARGS.rounds)
+    elif sys.argv[1] == 'clean_data':
+        bench_clean_data(load_bodies(ARGS.inputs, ARGS.count), ARGS.rounds)
+
+    sys.exit(0)
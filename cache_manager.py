@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Cache manager
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+from argparse import ArgumentParser
+import sys
+
+# Third party library imports
+from tabulate import tabulate
+
+# Own library
+from lib import cache
+
+# Debug
+# from pdb import set_trace as st
+
+VERSION = '1.0.0'
+
+def print_stats():
+    """
+    Prints the statistics of the cache
+    """
+    stats = cache.get_stats()
+    expired_share = 100 * stats['expired'] / stats['entries'] if stats['entries'] else 0
+    print(tabulate([
+        ['Backend', cache.get_setting('CACHE_BACKEND', 'sqlite')],
+        ['Entries', stats['entries']],
+        ['Size', f"{stats['bytes'] / 1024 / 1024:.2f} MB"],
+        ['Expired', f"{stats['expired']} ({expired_share:.1f} %)"],
+        ['Hits', stats['hits']],
+        ['Misses', stats['misses']],
+        ['Hit ratio', f"{100 * stats['hit_ratio']:.1f} %"],
+    ]))
+
+def main():
+    """
+    Main function
+    """
+    parser = ArgumentParser()
+
+    subparsers = parser.add_subparsers(help='commands', dest='command')
+
+    parser.add_argument('--version', action='version', version=VERSION)
+
+    subparsers.add_parser('stats', help='Display the cache statistics')
+
+    prune_parser = subparsers.add_parser('prune',\
+        help='Remove the expired entries that cannot be served stale or revalidated, '\
+            'and the oldest ones above the size limits')
+    prune_parser.add_argument('--max-entries', action='store', type=int,\
+        help='Maximum number of entries (=CACHE_MAX_ENTRIES)', default=None)
+    prune_parser.add_argument('--max-bytes', action='store', type=int,\
+        help='Maximum size in bytes (=CACHE_MAX_BYTES)', default=None)
+
+    subparsers.add_parser('clear', help='Remove all the cache entries')
+
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print_stats()
+    elif args.command == 'prune':
+        print(f'{cache.prune(args.max_entries, args.max_bytes)} entries removed')
+    elif args.command == 'clear':
+        cache.clear()
+        print('Cache cleared')
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
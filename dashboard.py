@@ -37,7 +37,7 @@ def main():
         if ',' in isin:
             market = isin.split(',')[1]
             isin = isin.split(',', maxsplit=1)[0]
-        isin_data = reporting.get_cours(isin, market, disable_cache=True)
+        isin_data = reporting.get_cours(isin, market, disable_cache=True, profile='dashboard')
         if not isin_data:
             listing.append([])
             continue
@@ -12,7 +12,7 @@ from argparse import ArgumentParser
 import sys
 
 # Own library
-from lib import common, display, reporting
+from lib import cache, common, display, reporting
 
 # Debug
 # from pdb import set_trace as st
@@ -48,6 +48,8 @@ if __name__ == '__main__':
     PARAMS['isin'] = ARGS.isin
     PARAMS['mic'] = ARGS.market_id_code
     PARAMS['header'] = not ARGS.no_header
+    PARAMS['profile'] = 'report'
+    PARAMS['stale'] = cache.get_setting('STALE_WHILE_REVALIDATE', False)
     if not ARGS.isin and not ARGS.nom:
         PARSER.print_help()
         sys.exit(1)
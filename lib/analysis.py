@@ -7,43 +7,74 @@ Licensed under the MIT License
 Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
 """
 
+# Standard library imports
+from bisect import bisect_left
+from functools import lru_cache
+
 # Debug
 # from pdb import set_trace as st
 
+# A value gets the label of the first threshold it is lower or equal to,
+# the last label being for the values above all the thresholds
+PER_THRESHOLDS = (0, 10, 17, 25)
+PER_LABELS = (
+    'aucune croissance annoncée',
+    'croissance annoncée raisonable',
+    'croissance annoncée forte',
+    'croissance annoncée énorme',
+    'croissance annoncée extraordinaire',
+)
+PER_SENTINELS = {'-': 'inconnu'}
+
+PEG_THRESHOLDS = (0, 0.5, 1, 2.5, 3.5)
+PEG_LABELS = (
+    'action sans bénéfices',
+    'action sous-évaluée',
+    'ration bon',
+    'action surévaluée',
+    'bulle spéculative',
+    'bulle spéculative',
+)
+PEG_SENTINELS = {'-': 'inconnu', 'infini': 'bulle spéculative'}
+
+def classify(values, thresholds, labels, sentinels):
+    """
+    Returns the labels of the values
+    """
+    result = []
+    for value in values:
+        if isinstance(value, str) and value in sentinels:
+            result.append(sentinels[value])
+            continue
+        number = float(value)
+        if number != number: # NaN is above all the thresholds
+            result.append(labels[-1])
+        else:
+            result.append(labels[bisect_left(thresholds, number)])
+    return result
+
+def classify_per(per_values):
+    """
+    Retuns the analysis of each PER value
+    """
+    return classify(per_values, PER_THRESHOLDS, PER_LABELS, PER_SENTINELS)
+
+def classify_peg(peg_values):
+    """
+    Retuns the analysis of each PEG value
+    """
+    return classify(peg_values, PEG_THRESHOLDS, PEG_LABELS, PEG_SENTINELS)
+
+@lru_cache(maxsize=4096)
 def per_text(per_value):
     """
     Retuns the analysis of the PER value
     """
-    if per_value == '-':
-        return 'inconnu'
-    result = 'croissance annoncée extraordinaire'
-    if float(per_value) <= 0:
-        result = 'aucune croissance annoncée'
-    elif float(per_value) <= 10:
-        result = 'croissance annoncée raisonable'
-    elif float(per_value) <= 17:
-        result = 'croissance annoncée forte'
-    elif float(per_value) <= 25:
-        result = 'croissance annoncée énorme'
-    return result
+    return classify_per((per_value,))[0]
 
+@lru_cache(maxsize=4096)
 def peg_text(peg_value):
     """
     Retuns the analysis of the PEG value
     """
-    if peg_value == '-':
-        return 'inconnu'
-    if peg_value == 'infini':
-        return 'bulle spéculative'
-    result = 'bulle spéculative'
-    if float(peg_value) <= 0:
-        result = 'action sans bénéfices'
-    elif float(peg_value) <= 0.5:
-        result = 'action sous-évaluée'
-    elif float(peg_value) <= 1:
-        result = 'ration bon'
-    elif float(peg_value) <= 2.5:
-        result = 'action surévaluée'
-    elif float(peg_value) <= 3.5:
-        result = 'bulle spéculative'
-    return result
+    return classify_peg((peg_value,))[0]
@@ -8,16 +8,20 @@ Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
 """
 
 # Standard library imports
+import atexit
 from base64 import b64decode
 from codecs import getencoder
 from datetime import datetime
 from hashlib import sha512
 import json
-import os
+import marshal
 from pathlib import Path
-from random import randint
+from random import randint, uniform
 import re
+import threading
 import time
+from urllib.parse import parse_qsl, urlencode
+import zlib
 
 # Third party library imports
 from requests import exceptions, Session
@@ -26,6 +30,7 @@ import urllib3
 # Own library
 # pylint: disable=E0401,E1101
 # pylint: disable=fixme,unused-argument
+from lib import store
 import settings
 
 # Debug
@@ -35,9 +40,124 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 SESSION = Session()
 
+# Cache store, opened on first use
+STORE = []
+STORE_LOCK = threading.Lock()
+
+# Requests in flight by key, shared by the concurrent callers
+IN_FLIGHT = {}
+IN_FLIGHT_LOCK = threading.Lock()
+
+# Hashes of the urls revalidated in the background
+REFRESHING = set()
+REFRESHING_LOCK = threading.Lock()
+
+# Lookups of the process, added to the store ones at exit
+COUNTERS = {'hits': 0, 'misses': 0, 'writes': 0}
+COUNTERS_LOCK = threading.Lock()
+
+# Enforce the cache size limits every PRUNE_INTERVAL writes
+PRUNE_INTERVAL = 100
+
 # TTL = 60 # 1 minute
 TTL = 21600 # 6 hours
 
+# Prefix of the compressed cache payloads, never found at the start of a text payload
+COMPRESSED_MARKER = b'\x00z1'
+
+# Throttled or server errors worth another attempt
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+def get_setting(name, default):
+    """
+    Returns the setting value, or the default one if it is not set
+    """
+    return getattr(settings, name, default)
+
+class RequestScheduler:
+    """
+    Shared scheduler of the upstream requests: a token bucket limits the rate,
+    a semaphore limits the in-flight requests, and throttled (429) or failed (5xx)
+    requests are retried with an exponential backoff and jitter.
+    The rate is halved on each 429 and slowly restored on success.
+    """
+    def __init__(self, rate, burst, max_in_flight, max_retries, backoff_base, backoff_max):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def acquire(self):
+        """
+        Waits for a token of the bucket
+        """
+        if self.max_rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adapt(self, status_code):
+        """
+        Adapts the rate to the upstream answer
+        """
+        if self.max_rate <= 0:
+            return
+        with self.lock:
+            if status_code == 429:
+                self.rate = max(self.max_rate / 16, self.rate / 2)
+            elif status_code < 400:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def get_delay(self, attempt, req):
+        """
+        Returns the delay before the next attempt, Retry-After first
+        """
+        if req is not None and req.headers.get('Retry-After', '').isdigit():
+            return min(self.backoff_max, int(req.headers['Retry-After']))
+        return uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        """
+        Returns the response of the request, or None if the upstream is unreachable
+        """
+        req = None
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            with self.in_flight:
+                try:
+                    req = SESSION.request(method, url, **kwargs)
+                except exceptions.ConnectionError:
+                    req = None
+            if req is not None:
+                self.adapt(req.status_code)
+                if req.status_code not in RETRY_STATUS:
+                    return req
+            if attempt < self.max_retries:
+                time.sleep(self.get_delay(attempt, req))
+        return req
+
+SCHEDULER = RequestScheduler(
+    rate=get_setting('RATE_LIMIT', 10),
+    burst=get_setting('RATE_BURST', 10),
+    max_in_flight=get_setting('MAX_IN_FLIGHT', 8),
+    max_retries=get_setting('MAX_RETRIES', 4),
+    backoff_base=get_setting('BACKOFF_BASE', 0.5),
+    backoff_max=get_setting('BACKOFF_MAX', 30))
+
 def decode_rot(encoded_str):
     """
     Returns the ROT-13 of the input string
@@ -54,31 +174,55 @@ def gen_user_agent():
         f'(KHTML, like Gecko) Version/17.{randint(1, 100)} ' + \
         f'Safari/605.1.{randint(1, 100)}'
 
-def get_token():
+# Renew the token this many seconds before it expires
+TOKEN_MARGIN = 60
+# Delay before a new attempt when the token cannot be retrieved
+TOKEN_RETRY_DELAY = 60
+
+USER_AGENT = gen_user_agent()
+
+# In-memory token, resolved on the first network request
+TOKEN = {'value': '', 'exp': 0}
+TOKEN_LOCK = threading.Lock()
+
+def get_token_exp(token):
+    """
+    Returns the expiration timestamp of the token, 0 if invalid
+    """
+    try:
+        return json.loads(b64decode(token.split('.')[1]+'=='))['exp']
+    except (IndexError, KeyError, TypeError, ValueError):
+        return 0
+
+def get_token(renew=False):
     """
     Returns new token
     """
     token_path = Path('/tmp/financial_token.jwt')
+    if renew and token_path.exists():
+        token_path.unlink()
     if token_path.exists():
         token = token_path.open('r', encoding='utf-8').read()
         if len(token.split('.')) <= 1:
             print('Error retrieving token... (jwt invalid). Removing token.')
             token_path.unlink()
             return ''
-        try:
-            if datetime.timestamp(datetime.now()) < json.loads(b64decode(token.split('.')[1]+'=='))['exp']:
-                return token
-        except:
+        exp = get_token_exp(token)
+        if not exp:
             print('Error retrieving token... (exp not found). Removing token.')
             token_path.unlink()
             return ''
-    content = SESSION.get(
+        if datetime.timestamp(datetime.now()) < exp - TOKEN_MARGIN:
+            return token
+    content = SCHEDULER.request(
+        'GET',
         decode_rot('uggcf://vairfgve.yrfrpubf.se/pbhef/npgvbaf/xrevat-xre-se0000121485-kcne'),
         headers={'User-Agent': gen_user_agent(), 'Sec-Fetch-Dest': 'document', 'Sec-Fetch-Mode': 'navigate'})
-    if content.status_code != 200:
+    if content is None or content.status_code != 200:
         print('Error retrieving token... (page not found)')
         return ''
-    result = re.findall('_TOKEN__="[a-zA-Z0-9\.=\-\_]+"', content.text)[0].split('"')
+    result = re.findall('_TOKEN__="[a-zA-Z0-9\.=\-\_]+"', content.text)
+    result = result[0].split('"') if result else []
     if len(result) <= 1 or not result[1].startswith('ey'):
         print('Error retrieving token... (token not found)')
         return ''
@@ -86,14 +230,48 @@ def get_token():
     token_path.open('w', encoding='utf-8').write(token)
     return token
 
-def gen_headers():
+def set_token(token):
+    """
+    Sets the in-memory token
+    """
+    with TOKEN_LOCK:
+        TOKEN['value'] = token
+        TOKEN['exp'] = get_token_exp(token) or float('inf')
+
+def get_auth_token(renew=False, failed_token=None):
+    """
+    Returns the in-memory token, retrieved lazily and renewed before it expires.
+    A renewal for a failed token is skipped if another thread already replaced it.
+    """
+    with TOKEN_LOCK:
+        if renew and failed_token is not None and TOKEN['value'] != failed_token:
+            return TOKEN['value']
+        if renew or time.time() >= TOKEN['exp'] - TOKEN_MARGIN:
+            token = get_token(renew=renew)
+            TOKEN['value'] = token
+            TOKEN['exp'] = get_token_exp(token) or time.time() + TOKEN_MARGIN + TOKEN_RETRY_DELAY
+        return TOKEN['value']
+
+def gen_headers(renew=False, failed_token=None):
     """
     Returns headers
     """
-    return {'Authorization': f'Bearer {get_token()}',
-        'User-Agent': gen_user_agent()}
+    return {'Authorization': f'Bearer {get_auth_token(renew=renew, failed_token=failed_token)}',
+        'User-Agent': USER_AGENT}
 
-HEADERS = gen_headers()
+def send(method, url, headers=None, **kwargs):
+    """
+    Sends the authenticated request, renewing the token once on 401
+    """
+    extra_headers = headers or {}
+    request_headers = {**gen_headers(), **extra_headers}
+    req = SCHEDULER.request(method, url, headers=request_headers, **kwargs)
+    if req is not None and req.status_code == 401:
+        failed_token = request_headers['Authorization'][len('Bearer '):]
+        req = SCHEDULER.request(method, url,
+            headers={**gen_headers(renew=True, failed_token=failed_token), **extra_headers},
+            **kwargs)
+    return req
 
 def get_hash(string):
     """
@@ -103,96 +281,413 @@ def get_hash(string):
     sha.update(string.encode())
     return sha.hexdigest()
 
-def is_expired(hash_key):
+def get_store():
+    """
+    Returns the cache store, opened on first use
+    """
+    with STORE_LOCK:
+        if not STORE:
+            STORE.append(store.new_store(
+                get_setting('CACHE_BACKEND', 'sqlite'),
+                get_setting('CACHE_DIR', 'cache'),
+                TTL))
+        return STORE[0]
+
+MEMORY = store.MemoryStore(
+    max_entries=get_setting('MEMORY_CACHE_ENTRIES', 1024),
+    max_bytes=get_setting('MEMORY_CACHE_BYTES', 64 * 1024 * 1024))
+
+def count(name):
+    """
+    Increments the counter, returns its new value
+    """
+    with COUNTERS_LOCK:
+        COUNTERS[name] += 1
+        return COUNTERS[name]
+
+def flush_counters():
+    """
+    Adds the lookup counters of the process to the store ones
+    """
+    with COUNTERS_LOCK:
+        counters = {'hits': COUNTERS['hits'], 'misses': COUNTERS['misses']}
+        COUNTERS['hits'] = COUNTERS['misses'] = 0
+    if STORE and any(counters.values()):
+        get_store().add_counters(counters)
+
+atexit.register(flush_counters)
+
+def get_stats():
+    """
+    Returns the statistics of the cache store
+    """
+    flush_counters()
+    return get_store().stats()
+
+def prune(max_entries=None, max_bytes=None):
+    """
+    Removes the expired entries that can neither be served stale (STALE_MAX_AGE)
+    nor revalidated, then the oldest ones above the size limits,
+    returns the number of removed entries
+    """
+    if max_entries is None:
+        max_entries = get_setting('CACHE_MAX_ENTRIES', 0)
+    if max_bytes is None:
+        max_bytes = get_setting('CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    return get_store().prune(max_entries, max_bytes,
+        stale_max_age=get_setting('STALE_MAX_AGE', 7 * 86400))
+
+def clear():
+    """
+    Removes all the cache entries
+    """
+    MEMORY.clear()
+    get_store().clear()
+
+def encode_content(content):
+    """
+    Returns the payload stored for the content, compressed if enabled
+    """
+    raw_content = content.encode('utf-8')
+    if not get_setting('CACHE_COMPRESSION', True):
+        return raw_content
+    return COMPRESSED_MARKER + zlib.compress(raw_content, get_setting('CACHE_COMPRESSION_LEVEL', 6))
+
+def decode_content(raw_content):
+    """
+    Returns the content of the stored payload, compressed or not
+    """
+    if raw_content.startswith(COMPRESSED_MARKER):
+        raw_content = zlib.decompress(raw_content[len(COMPRESSED_MARKER):])
+    return raw_content.decode('utf-8')
+
+def is_expired(entry):
     """
     Returns True if the content in cache is expired
     """
-    return int(time.time()) - os.path.getctime('cache/{}'.format(hash_key)) > TTL
+    return time.time() - entry['created'] > entry['ttl']
+
+def get_entry(url_hash):
+    """
+    Returns the entry in cache with its decoded content, expired or not, None if absent
+    """
+    entry = get_store().get(url_hash)
+    if entry is None:
+        return None
+    try:
+        entry['content'] = decode_content(entry['content'])
+    except (UnicodeDecodeError, zlib.error):
+        purge_cache(url_hash)
+        return None
+    return entry
+
+def lookup(url_hash):
+    """
+    Returns the fresh content in cache, None otherwise
+    """
+    content, _ = lookup_entry(url_hash)
+    return content
+
+def lookup_entry(url_hash):
+    """
+    Returns the fresh content in cache, and the expired entry if any
+    """
+    content = MEMORY.get(url_hash)
+    if content is not None:
+        return content, None
+    entry = get_entry(url_hash)
+    if entry is None:
+        return None, None
+    if is_expired(entry):
+        return None, entry
+    MEMORY.set(url_hash, entry['content'], len(entry['content']), entry['created'] + entry['ttl'])
+    return entry['content'], None
+
+def is_stale_usable(entry, stale):
+    """
+    Returns True if the expired entry can be served while it is revalidated
+    """
+    return stale and time.time() - entry['created'] <= \
+        entry['ttl'] + get_setting('STALE_MAX_AGE', 7 * 86400)
+
+def peek(url, disable_cache=False):
+    """
+    Returns the fresh content of the url in cache, without requesting it, None otherwise
+    """
+    if not is_cache_enabled(disable_cache):
+        return None
+    return lookup(get_hash(url))
 
 def is_in_cache(url):
     """
     Return True is the url is in cache
     """
-    url_hash = get_hash(url)
-    if not os.path.exists('cache'):
-        os.mkdir('cache')
-        return False
-    if not os.path.exists('cache/{}'.format(url_hash)):
-        return False
-    if is_expired(url_hash):
-        return False
-    return True
+    return lookup(get_hash(url)) is not None
 
-def purge_cache(cache_path):
+def purge_cache(url_hash):
     """
     Remove cache is present
     """
-    if os.path.exists(cache_path):
-        os.remove(cache_path)
+    MEMORY.delete(url_hash)
+    get_store().delete(url_hash)
 
-def save(url, content):
+def get_validators(response):
     """
-    Save the content in the cache
+    Returns the HTTP validators of the response
+    """
+    validators = {}
+    if response.headers.get('ETag'):
+        validators['etag'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        validators['last_modified'] = response.headers['Last-Modified']
+    return validators
+
+def store_content(url_hash, content, validators=None):
+    """
+    Save the content of the hash in the cache
     """
-    cache_path = 'cache/{}'.format(get_hash(url))
-    if not os.path.exists('cache'):
-        os.mkdir('cache')
     try:
-        with open(cache_path, 'w') as url_file:
-            url_file.write(content)
+        raw_content = encode_content(content)
     except UnicodeEncodeError:
-        purge_cache(cache_path)
+        purge_cache(url_hash)
+        return
+    get_store().set(url_hash, raw_content, TTL, validators=validators)
+    MEMORY.set(url_hash, content, len(content), time.time() + TTL)
+    if count('writes') % PRUNE_INTERVAL == 0:
+        prune()
+
+def save(url, content):
+    """
+    Save the content in the cache
+    """
+    store_content(get_hash(url), content)
 
 def load(url):
     """
     Returns the url's content from the cache
     """
-    cache_path = 'cache/{}'.format(get_hash(url))
-    try:
-        with open(cache_path, 'r') as url_file:
-            content = url_file.read()
-    except UnicodeDecodeError:
-        purge_cache(cache_path)
+    content = lookup(get_hash(url))
+    if content is None:
         content = get(url, verify=False, disable_cache=True)
     return content
 
-def get(url, verify=True, disable_cache=False, token=''):
+def fetch(url, url_hash, verify, enable_cache, entry=None, payload=None):
     """
-    Requests the url is not in cache
+    Requests the url, posting the payload if any,
+    revalidating the expired entry if the upstream gave validators
     """
-    if token:
-        HEADERS['Authorization'] = f'Bearer {token}'
-    try:
-        enable_cache = settings.ENABLE_CACHE and not disable_cache
-    except AttributeError:
-        enable_cache = not disable_cache
-    if is_in_cache(url) and enable_cache:
-        return load(url)
-    try:
-        req = SESSION.get(url, verify=verify, allow_redirects=False, headers=HEADERS)
-    except exceptions.ConnectionError:
+    headers = {}
+    if entry is not None and payload is None:
+        validators = get_store().validators(url_hash)
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+    if payload is None:
+        req = send('GET', url, verify=verify, allow_redirects=False, headers=headers)
+    else:
+        req = send(
+            'POST',
+            url,
+            data=payload,
+            verify=verify,
+            allow_redirects=False,
+            headers={'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'})
+    if req is None:
         return ''
+    if req.status_code == 304 and headers:
+        get_store().touch(url_hash)
+        MEMORY.set(url_hash, entry['content'], len(entry['content']), time.time() + TTL)
+        return entry['content']
     if req.ok and req.status_code == 200:
         if enable_cache:
-            save(url, req.text)
+            store_content(url_hash, req.text, validators=get_validators(req))
         return req.text
     return ''
 
-def post(url, payload, verify=True, disable_cache=False):
+def single_flight(key, function, *args):
     """
-    Requests the url is not in cache
+    Runs the function once for the concurrent callers of the same key,
+    which all get its result
     """
-    # TODO: implement cache
-    HEADERS.update({'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'})
+    with IN_FLIGHT_LOCK:
+        flight = IN_FLIGHT.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = {'done': threading.Event(), 'result': ''}
+            IN_FLIGHT[key] = flight
+    if not is_leader:
+        flight['done'].wait()
+        return flight['result']
     try:
-        req = SESSION.post(
-            url,
-            data=payload,
-            verify=verify,
-            allow_redirects=False,
-            headers=HEADERS)
-    except exceptions.ConnectionError:
-        return ''
-    if req.ok and req.status_code == 200:
-        return req.text
-    return ''
+        flight['result'] = function(*args)
+    finally:
+        with IN_FLIGHT_LOCK:
+            del IN_FLIGHT[key]
+        flight['done'].set()
+    return flight['result']
+
+def refresh(url, url_hash, verify, entry, payload=None):
+    """
+    Revalidates the expired entry in the background
+    """
+    with REFRESHING_LOCK:
+        if url_hash in REFRESHING:
+            return
+        REFRESHING.add(url_hash)
+
+    def run():
+        try:
+            single_flight(url_hash, fetch, url, url_hash, verify, True, entry, payload)
+        finally:
+            with REFRESHING_LOCK:
+                REFRESHING.discard(url_hash)
+
+    threading.Thread(target=run).start()
+
+def is_cache_enabled(disable_cache):
+    """
+    Returns True if the cache is enabled in the settings and not disabled by the caller
+    """
+    try:
+        return settings.ENABLE_CACHE and not disable_cache
+    except AttributeError:
+        return not disable_cache
+
+def request(url, url_hash, verify, enable_cache, stale, payload=None):
+    """
+    Returns the content of the url_hash from the cache, or from the upstream
+    """
+    entry = None
+    if enable_cache:
+        content, entry = lookup_entry(url_hash)
+        if content is not None:
+            count('hits')
+            return content
+        count('misses')
+        if entry is not None and is_stale_usable(entry, stale):
+            refresh(url, url_hash, verify, entry, payload)
+            return entry['content']
+    return single_flight(url_hash, fetch, url, url_hash, verify, enable_cache, entry, payload)
+
+def get(url, verify=True, disable_cache=False, token='', stale=False):
+    """
+    Requests the url is not in cache.
+    With stale, an expired content (up to STALE_MAX_AGE) is returned at once
+    and revalidated in the background.
+    """
+    if token:
+        set_token(token)
+    return request(url, get_hash(url), verify, is_cache_enabled(disable_cache), stale)
+
+def canonical_payload(payload):
+    """
+    Returns the canonical form of the payload: sorted form-encoded fields
+    """
+    if isinstance(payload, dict):
+        return urlencode(sorted(payload.items()), doseq=True)
+    if isinstance(payload, (list, tuple)):
+        return urlencode(sorted(payload), doseq=True)
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8', errors='replace')
+    return urlencode(sorted(parse_qsl(str(payload), keep_blank_values=True)))
+
+def post(url, payload, verify=True, disable_cache=False, stale=False):
+    """
+    Requests the url is not in cache, the cache key being the url and the payload
+    """
+    url_hash = get_hash(f'POST {url}\n{canonical_payload(payload)}')
+    return request(url, url_hash, verify, is_cache_enabled(disable_cache), stale, payload=payload)
+
+def get_parsed_hash(url, parse):
+    """
+    Returns the cache key of the url parsed by the parse function
+    """
+    return get_hash(f'PARSED {parse.__module__}.{parse.__qualname__} {url}')
+
+def lookup_parsed(parsed_hash):
+    """
+    Returns the fresh parsed object in cache, None otherwise
+    """
+    raw_object = MEMORY.get(parsed_hash)
+    if raw_object is None:
+        entry = get_store().get(parsed_hash)
+        if entry is None or is_expired(entry):
+            return None
+        raw_object = entry['content']
+        if raw_object.startswith(COMPRESSED_MARKER):
+            raw_object = zlib.decompress(raw_object[len(COMPRESSED_MARKER):])
+        MEMORY.set(parsed_hash, raw_object, len(raw_object), entry['created'] + entry['ttl'])
+    try:
+        return marshal.loads(raw_object)
+    except (EOFError, TypeError, ValueError):
+        # Not marshal data, e.g. written by an older version
+        purge_cache(parsed_hash)
+        return None
+
+def store_parsed(url, parsed_hash, content, parsed_object):
+    """
+    Save the object parsed from the content in the cache, expiring with the raw content
+    of the url, unless the content is stale or was replaced meanwhile
+    """
+    entry = get_entry(get_hash(url))
+    ttl = TTL
+    if entry is not None:
+        ttl = int(entry['created'] + entry['ttl'] - time.time())
+        if ttl <= 0 or entry['content'] != content:
+            # Parsed from a stale content, being or already revalidated
+            return
+    # marshal rather than pickle: loading the cache must never run code
+    try:
+        raw_object = marshal.dumps(parsed_object)
+    except ValueError:
+        return
+    payload = raw_object
+    if get_setting('CACHE_COMPRESSION', True):
+        payload = COMPRESSED_MARKER + zlib.compress(
+            raw_object, get_setting('CACHE_COMPRESSION_LEVEL', 6))
+    get_store().set(parsed_hash, payload, ttl)
+    MEMORY.set(parsed_hash, raw_object, len(raw_object), time.time() + ttl)
+
+def parse_content(url, parsed_hash, content, parse):
+    """
+    Returns the parsed content, cached if enabled
+    """
+    parsed_object = parse(content)
+    if get_setting('CACHE_PARSED', True):
+        store_parsed(url, parsed_hash, content, parsed_object)
+    return parsed_object
+
+def peek_parsed(url, parse, disable_cache=False):
+    """
+    Returns the parsed content of the url in cache, without requesting it, None otherwise
+    """
+    if not is_cache_enabled(disable_cache):
+        return None
+    parsed_hash = get_parsed_hash(url, parse)
+    if get_setting('CACHE_PARSED', True):
+        parsed_object = lookup_parsed(parsed_hash)
+        if parsed_object is not None:
+            return parsed_object
+    content = peek(url)
+    if not content:
+        return None
+    return parse_content(url, parsed_hash, content, parse)
+
+def get_parsed(url, parse, disable_cache=False, stale=False):
+    """
+    Returns the content of the url parsed by the parse function, None if empty.
+    The parsed object, of builtin types, is cached next to the raw content (CACHE_PARSED),
+    so that a cache hit skips the parsing.
+    """
+    if not is_cache_enabled(disable_cache):
+        content = get(url, disable_cache=True)
+        return parse(content) if content else None
+    parsed_object = peek_parsed(url, parse)
+    if parsed_object is not None:
+        count('hits')
+        return parsed_object
+    content = get(url, stale=stale)
+    if not content:
+        return None
+    return parse_content(url, get_parsed_hash(url, parse), content, parse)
@@ -19,22 +19,36 @@ from lib import cache
 # Debug
 # from pdb import set_trace as st
 
+# Html tags and escaped sequences removed from the responses, in one pass
+# pylint: disable=W1401
+SCRUB = re.compile('<[a-zA-Z0-9\.\\\/\"\'=\ ]+>' + '|;|\\\\n|\\\\t|\n|\t|&euro|&#039|\xa0')
+SCRUB_REPLACEMENTS = {'&#039': "'"}
+# Every scrubbed sequence contains one of these characters
+SCRUB_CHARS = ('<', ';', '\\', '\n', '\t', '&', '\xa0')
+
+def scrub(match):
+    """
+    Returns the replacement of the scrubbed sequence
+    """
+    return SCRUB_REPLACEMENTS.get(match.group(), '')
+
+def needs_scrub(raw_data):
+    """
+    Returns True if the data may contain a sequence to scrub
+    """
+    for char in SCRUB_CHARS:
+        if char in raw_data:
+            return True
+    return False
+
 def clean_data(raw_data, json_load=True):
     """
     Returns cleaned data
     """
-    # Remove html
-    # pylint: disable=W1401
-    cleaned_data = re.sub('<[a-zA-Z0-9\.\\\/\"\'=\ ]+>', '', raw_data)
-    cleaned_data = cleaned_data.\
-                      replace(';', '').\
-                      replace('\\n', '').\
-                      replace('\\t', '').\
-                      replace('\n', '').\
-                      replace('\t', '').\
-                      replace('&euro', '').\
-                      replace('&#039', "'").\
-                      replace('\xa0', '')
+    cleaned_data = raw_data
+    # Fast path: nothing to scrub, the body is returned as is
+    if needs_scrub(raw_data):
+        cleaned_data = SCRUB.sub(scrub, raw_data)
     if json_load:
         cleaned_data = json.loads(cleaned_data)
     return cleaned_data
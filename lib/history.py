@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+History library
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+from array import array
+import json
+import mmap
+from pathlib import Path
+
+# Own library
+# pylint: disable=E0401
+from lib import quote, snapshot, store
+
+# Debug
+# from pdb import set_trace as st
+
+# Columnar store of the saved daily reports: one '<FIELD>.f64' file per numeric
+# field, holding a date x ISIN matrix of float64 (NaN when missing), one row per
+# date of 'stride' values. meta.json lists the dates (rows) and the ISIN (columns).
+
+NAN = float('nan')
+ITEM_SIZE = array('d').itemsize
+
+def read_meta(history_dir):
+    """
+    Returns the metadata of the history
+    """
+    try:
+        return json.loads((Path(history_dir) / 'meta.json').read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return {'dates': [], 'isins': [], 'stride': 0, 'fields': []}
+
+def write_meta(history_dir, meta):
+    """
+    Writes the metadata of the history, atomically
+    """
+    store.write_atomic(Path(history_dir) / 'meta.json', json.dumps(meta).encode('utf-8'))
+
+def get_numeric_values(report):
+    """
+    Returns the numeric values of the report by field name
+    """
+    values = {}
+    for name, entry in report.items():
+        if isinstance(entry, dict):
+            entry = entry.get('v')
+        if quote.is_number(entry):
+            values[name] = float(entry)
+    return values
+
+def read_matrix(path, rows, stride):
+    """
+    Returns the rows x stride matrix of the field file, as a flat array
+    """
+    matrix = array('d')
+    if path.exists():
+        with path.open('rb') as field_file:
+            matrix.frombytes(field_file.read(rows * stride * ITEM_SIZE))
+    matrix.extend([NAN] * (rows * stride - len(matrix)))
+    return matrix
+
+def restripe(history_dir, meta, stride, row=None):
+    """
+    Rewrites the field files with a new stride, inserting an empty row at the row index
+    """
+    rows = len(meta['dates'])
+    for field in meta['fields']:
+        path = Path(history_dir) / f'{field}.f64'
+        matrix = read_matrix(path, rows, meta['stride'])
+        result = array('d')
+        for index in range(rows):
+            if index == row:
+                result.extend([NAN] * stride)
+            result.extend(matrix[index * meta['stride']:(index + 1) * meta['stride']])
+            result.extend([NAN] * (stride - meta['stride']))
+        if row == rows:
+            result.extend([NAN] * stride)
+        store.write_atomic(path, result.tobytes())
+    meta['stride'] = stride
+
+def append_day(history_dir, date, reports):
+    """
+    Stores the reports of the date (YYYY_MM_DD), replacing the row of the date if present
+    """
+    history_dir = Path(history_dir)
+    history_dir.mkdir(parents=True, exist_ok=True)
+    meta = read_meta(history_dir)
+    for report in reports:
+        if report['isin'] not in meta['isins']:
+            meta['isins'].append(report['isin'])
+    stride = meta['stride']
+    if len(meta['isins']) > stride:
+        stride = max(len(meta['isins']), 2 * stride)
+    if date in meta['dates']:
+        row = meta['dates'].index(date)
+        if stride != meta['stride']:
+            restripe(history_dir, meta, stride)
+    elif meta['dates'] and date < meta['dates'][-1]:
+        # Older day: insert its row to keep the rows sorted by date
+        row = next(index for index, day in enumerate(meta['dates']) if day > date)
+        restripe(history_dir, meta, stride, row=row)
+        meta['dates'].insert(row, date)
+    else:
+        if stride != meta['stride']:
+            restripe(history_dir, meta, stride)
+        row = len(meta['dates'])
+        meta['dates'].append(date)
+
+    columns = {isin: index for index, isin in enumerate(meta['isins'])}
+    rows = {}
+    for report in reports:
+        for field, value in get_numeric_values(report).items():
+            if field not in rows:
+                rows[field] = array('d', [NAN] * stride)
+            rows[field][columns[report['isin']]] = value
+    for field in rows:
+        if field not in meta['fields']:
+            meta['fields'].append(field)
+
+    for field in meta['fields']:
+        path = history_dir / f'{field}.f64'
+        values = rows.get(field, array('d', [NAN] * stride))
+        with path.open('r+b' if path.exists() else 'w+b') as field_file:
+            field_file.seek(0, 2)
+            # Pad the previous days of a new field
+            if field_file.tell() < row * stride * ITEM_SIZE:
+                field_file.write(array('d', [NAN]).tobytes() * \
+                    (row * stride - field_file.tell() // ITEM_SIZE))
+            field_file.seek(row * stride * ITEM_SIZE)
+            field_file.write(values.tobytes())
+    write_meta(history_dir, meta)
+
+def load_slice(history_dir, field, isins=None, days=0):
+    """
+    Returns the dates and the values of the field by ISIN over the last days (=all),
+    reading only the requested cells of the memory-mapped field file
+    """
+    meta = read_meta(history_dir)
+    dates = meta['dates'][-days:] if days else meta['dates']
+    start = len(meta['dates']) - len(dates)
+    if isins is None:
+        isins = meta['isins']
+    columns = {isin: meta['isins'].index(isin) for isin in isins if isin in meta['isins']}
+    result = {isin: [NAN] * len(dates) for isin in isins}
+    path = Path(history_dir) / f'{field}.f64'
+    if not dates or not columns or not path.exists() or path.stat().st_size == 0:
+        return dates, result
+    with path.open('rb') as field_file, \
+        mmap.mmap(field_file.fileno(), 0, access=mmap.ACCESS_READ) as field_map:
+        matrix = memoryview(field_map).cast('d')
+        try:
+            for isin, column in columns.items():
+                values = result[isin]
+                for index in range(len(dates)):
+                    offset = (start + index) * meta['stride'] + column
+                    if offset < len(matrix):
+                        values[index] = matrix[offset]
+        finally:
+            matrix.release()
+    return dates, result
+
+def read_daily_file(path):
+    """
+    Returns the reports of a daily JSONL file, skipping the invalid lines
+    """
+    reports = {}
+    for report in snapshot.iter_reports(path):
+        reports[report['isin']] = report
+    return list(reports.values())
+
+def import_daily_files(directory, history_dir=None):
+    """
+    Imports the daily YYYY_MM_DD.txt files of the directory into the history,
+    returns the number of imported days
+    """
+    if history_dir is None:
+        history_dir = Path(directory) / 'history'
+    paths = sorted(Path(directory).glob('*.txt'))
+    for path in paths:
+        append_day(history_dir, path.stem, read_daily_file(path))
+    return len(paths)
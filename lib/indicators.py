@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Indicators library
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+from copy import deepcopy
+import json
+from math import fsum, isnan, sqrt
+from pathlib import Path
+from statistics import stdev
+
+# Own library
+# pylint: disable=E0401
+from lib import history, store
+
+# Debug
+# from pdb import set_trace as st
+
+# Technical indicators of the LVAL_NORM of the columnar history. The state of each
+# ISIN (last prices, RSI averages, peak) is kept in 'indicators.json' as of the day
+# before the last one, so that a new day, or the last day saved again, only costs
+# the processing of the last days instead of the whole history.
+# The volatility only uses the returns between consecutive days: a missing price
+# breaks the series, the move over the gap not being a daily return. The RSI uses
+# the changes between the observed prices, across the gaps.
+
+FIELD = 'LVAL_NORM'
+NAN = float('nan')
+DEFAULT_WINDOWS = {'mm': [20, 50, 100], 'rsi': 14, 'volatility': 20}
+TRADING_DAYS = 252
+STATE_VERSION = 2
+
+def new_state(windows):
+    """
+    Returns the state before the first day
+    """
+    return {'version': STATE_VERSION, 'windows': windows, 'rows': 0, 'date': None, 'isins': {}}
+
+def read_state(history_dir, windows=None):
+    """
+    Returns the state of the indicators, a new one if the windows or the version differ
+    """
+    try:
+        state = json.loads((Path(history_dir) / 'indicators.json').read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return new_state(windows or DEFAULT_WINDOWS)
+    if state.get('version') != STATE_VERSION:
+        return new_state(windows or state['windows'])
+    if windows is not None and windows != state['windows']:
+        return new_state(windows)
+    return state
+
+def write_state(history_dir, state):
+    """
+    Writes the state of the indicators, atomically
+    """
+    store.write_atomic(Path(history_dir) / 'indicators.json', json.dumps(state).encode('utf-8'))
+
+def get_tail_size(windows):
+    """
+    Returns the number of last prices needed by the windows
+    """
+    return max(windows['mm'], default=1)
+
+def add_price(isin_state, price, windows):
+    """
+    Updates the state of an ISIN with the price of a new day
+    """
+    prices = isin_state['prices']
+    if prices and not isin_state['gap']:
+        isin_state['returns'].append(price / prices[-1] - 1)
+        del isin_state['returns'][:-windows['volatility']]
+    isin_state['gap'] = False
+    if prices:
+        change = price - prices[-1]
+        period = windows['rsi']
+        isin_state['count'] += 1
+        if isin_state['count'] <= period:
+            # Seed: simple mean of the first changes
+            isin_state['gain'] += max(change, 0.0) / period
+            isin_state['loss'] += max(-change, 0.0) / period
+        else:
+            # Wilder smoothing
+            isin_state['gain'] = (isin_state['gain'] * (period - 1) + max(change, 0.0)) / period
+            isin_state['loss'] = (isin_state['loss'] * (period - 1) + max(-change, 0.0)) / period
+    prices.append(price)
+    del prices[:-get_tail_size(windows)]
+    isin_state['peak'] = max(isin_state['peak'] or price, price)
+    isin_state['max_drawdown'] = min(isin_state['max_drawdown'], price / isin_state['peak'] - 1)
+
+def get_values(isin_state, windows):
+    """
+    Returns the indicators of an ISIN, NaN when the history is too short
+    """
+    prices = isin_state['prices']
+    values = {}
+    for window in windows['mm']:
+        values[f'MM{window}'] = fsum(prices[-window:]) / window if len(prices) >= window else NAN
+    period = windows['rsi']
+    values[f'RSI{period}'] = NAN
+    if isin_state['count'] >= period:
+        values[f'RSI{period}'] = 100.0 if isin_state['gain'] > 0 else 50.0
+        if isin_state['loss'] > 0:
+            values[f'RSI{period}'] = 100 - 100 / (1 + isin_state['gain'] / isin_state['loss'])
+    window = windows['volatility']
+    values[f'VOLATILITY{window}'] = NAN
+    if len(isin_state['returns']) >= window > 1:
+        # Annualized, in %
+        values[f'VOLATILITY{window}'] = 100 * stdev(isin_state['returns'][-window:]) * sqrt(TRADING_DAYS)
+    values['DRAWDOWN'] = 100 * (prices[-1] / isin_state['peak'] - 1)
+    values['MAX_DRAWDOWN'] = 100 * isin_state['max_drawdown']
+    return values
+
+def add_day(state, isins, prices, index):
+    """
+    Updates the state with the prices of the day at the index, missing ones skipped
+    and breaking the daily returns of their ISIN
+    """
+    for isin in isins:
+        price = prices[isin][index]
+        if isnan(price) or price <= 0:
+            if isin in state['isins']:
+                state['isins'][isin]['gap'] = True
+            continue
+        if isin not in state['isins']:
+            state['isins'][isin] = {'prices': [], 'returns': [], 'gap': False, 'count': 0,
+                'gain': 0.0, 'loss': 0.0, 'peak': None, 'max_drawdown': 0.0}
+        add_price(state['isins'][isin], price, state['windows'])
+
+def update(history_dir, windows=None):
+    """
+    Updates the indicators with the days appended to the history since the last update,
+    and returns the last date and the indicators by ISIN as of this date.
+    Windows (=the ones of the last update, DEFAULT_WINDOWS) are
+    {'mm': [days, ...], 'rsi': days, 'volatility': days}.
+    """
+    meta = history.read_meta(history_dir)
+    state = read_state(history_dir, windows)
+    rows = state['rows']
+    if rows and (rows >= len(meta['dates']) or meta['dates'][rows - 1] != state['date']):
+        # A day was inserted before the state, restart from the first day
+        state = new_state(state['windows'])
+        rows = 0
+    if not meta['dates']:
+        return None, {}
+    dates, prices = history.load_slice(history_dir, FIELD, days=len(meta['dates']) - rows)
+    for index in range(len(dates) - 1):
+        add_day(state, meta['isins'], prices, index)
+    checkpoint = deepcopy(state)
+    checkpoint['rows'] = len(meta['dates']) - 1
+    checkpoint['date'] = meta['dates'][-2] if len(meta['dates']) > 1 else None
+    write_state(history_dir, checkpoint)
+    add_day(state, meta['isins'], prices, len(dates) - 1)
+    values = {}
+    for isin, isin_state in state['isins'].items():
+        values[isin] = get_values(isin_state, state['windows'])
+    return dates[-1], values
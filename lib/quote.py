@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Quote library
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+from array import array
+import threading
+
+# Debug
+# from pdb import set_trace as st
+
+# Position of each numeric field in the Quote arrays, shared by all the quotes
+FIELD_INDEX = {}
+FIELD_NAMES = []
+FIELD_LOCK = threading.Lock()
+
+def get_field_index(name):
+    """
+    Returns the position of the field, registering it if new
+    """
+    index = FIELD_INDEX.get(name)
+    if index is None:
+        with FIELD_LOCK:
+            index = FIELD_INDEX.get(name)
+            if index is None:
+                index = len(FIELD_NAMES)
+                FIELD_NAMES.append(name)
+                FIELD_INDEX[name] = index
+    return index
+
+# Largest int stored exactly as a float
+MAX_EXACT_INT = 2 ** 53
+
+def is_number(value):
+    """
+    Returns True if the value is a float or an int stored exactly as a float,
+    booleans excluded
+    """
+    # pylint: disable=unidiomatic-typecheck
+    return type(value) is float or (type(value) is int and abs(value) <= MAX_EXACT_INT)
+
+class Quote:
+    """
+    Compact report: numeric values are stored as floats in an array indexed by
+    field name, with bitmasks telling which fields are present, which were ints
+    and which were plain values rather than {'v': value} entries.
+    Other entries (strings, descriptions) are kept as is.
+    The field indexes in insertion order keep the order of the report.
+    Reads like a report: quote['LVAL_NORM']['v'], 'DIVIDEND' in quote.
+    """
+    __slots__ = ('numbers', 'present', 'integers', 'scalars', 'others', 'order')
+
+    def __init__(self):
+        self.numbers = array('d')
+        self.present = 0
+        self.integers = 0
+        self.scalars = 0
+        self.others = {}
+        self.order = array('H')
+
+    @classmethod
+    def from_report(cls, report):
+        """
+        Returns the Quote of the report dict
+        """
+        quote = cls()
+        for name, entry in report.items():
+            quote[name] = entry
+        return quote
+
+    def to_report(self):
+        """
+        Returns the report dict of the Quote
+        """
+        report = {}
+        for name in self:
+            report[name] = self[name]
+        return report
+
+    def set_number(self, name, value, is_scalar):
+        """
+        Stores the numeric value of the field
+        """
+        index = get_field_index(name)
+        if index >= len(self.numbers):
+            self.numbers.extend([0.0] * (index + 1 - len(self.numbers)))
+        self.numbers[index] = value
+        bit = 1 << index
+        self.present |= bit
+        self.integers = self.integers | bit if isinstance(value, int) else self.integers & ~bit
+        self.scalars = self.scalars | bit if is_scalar else self.scalars & ~bit
+        self.others.pop(name, None)
+
+    def get_number(self, index):
+        """
+        Returns the numeric value at the index, as int if it was one
+        """
+        value = self.numbers[index]
+        if self.integers >> index & 1:
+            return int(value)
+        return value
+
+    def get(self, name, default=None):
+        """
+        Returns the value of the field: the 'v' of an entry, or the plain value
+        """
+        index = FIELD_INDEX.get(name)
+        if index is not None and self.present >> index & 1:
+            return self.get_number(index)
+        entry = self.others.get(name, default)
+        if isinstance(entry, dict) and 'v' in entry:
+            return entry['v']
+        return entry
+
+    def discard(self, name):
+        """
+        Removes the value of the field, keeping its position
+        """
+        index = FIELD_INDEX.get(name)
+        if index is not None:
+            self.present &= ~(1 << index)
+        self.others.pop(name, None)
+
+    def __setitem__(self, name, entry):
+        if name not in self:
+            self.order.append(get_field_index(name))
+        if is_number(entry):
+            self.set_number(name, entry, True)
+        elif isinstance(entry, dict) and len(entry) == 1 and is_number(entry.get('v')):
+            self.set_number(name, entry['v'], False)
+        else:
+            self.discard(name)
+            self.others[name] = entry
+
+    def __getitem__(self, name):
+        index = FIELD_INDEX.get(name)
+        if index is not None and self.present >> index & 1:
+            if self.scalars >> index & 1:
+                return self.get_number(index)
+            return {'v': self.get_number(index)}
+        return self.others[name]
+
+    def __delitem__(self, name):
+        if name in self:
+            self.order.remove(FIELD_INDEX[name])
+        self.discard(name)
+
+    def __contains__(self, name):
+        index = FIELD_INDEX.get(name)
+        if index is not None and self.present >> index & 1:
+            return True
+        return name in self.others
+
+    def __iter__(self):
+        for index in self.order:
+            yield FIELD_NAMES[index]
+
+    def __len__(self):
+        return len(self.order)
+
+    def __eq__(self, other):
+        if isinstance(other, Quote):
+            other = other.to_report()
+        return self.to_report() == other
+
+    def keys(self):
+        """
+        Returns the field names
+        """
+        return list(self)
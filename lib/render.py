@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Render library
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+import json
+import sys
+
+# Third party library imports
+from tabulate import tabulate
+
+# Debug
+# from pdb import set_trace as st
+
+FORMATS = ('text', 'html', 'json')
+
+TEMPLATES = {
+    'text': {
+        'begin': '',
+        'end': '',
+        'separator': '==============\n',
+        'list_begin': '',
+        'list_end': '==============\n',
+        'title': '{title}\n',
+        'item': '{label}: {text}\n',
+        'plain': '{text}',
+        'red': '{text}',
+        'green': '{text}',
+        'blue': '{text}',
+    },
+    'html': {
+        'begin': '<html><body>\n',
+        'end': '</body></html>\n',
+        'separator': '',
+        'list_begin': '<div><ul>\n',
+        'list_end': '</ul></div>\n',
+        'title': '<h3>{title}</h3>\n',
+        'item': '<li><b>{label}</b>: {text}</li>\n',
+        'plain': '{text}',
+        'red': '<span style="color: #f00;">{text}</span>',
+        'green': '<span style="color: #18b724;">{text}</span>',
+        'blue': '<span style="color: #007eff;">{text}</span>',
+    },
+}
+
+# Bound str.format of each template, looked up once per format
+COMPILED = {output_format: {name: template.format for name, template in templates.items()}
+    for output_format, templates in TEMPLATES.items()}
+
+def escape_html(text):
+    """
+    Returns the text escaped for an HTML element content, '>' kept as is
+    """
+    return text.replace('&', '&amp;').replace('<', '&lt;')
+
+class Renderer:
+    """
+    Document of sections (a title, with a list of items or not) and tables,
+    rendered as a whole in text, HTML or JSON and written at once.
+    In JSON, the sections and items keep their data, e.g. the numeric values.
+    """
+    def __init__(self, output_format='text', separated=False):
+        if output_format not in FORMATS:
+            raise ValueError(f'Unknown format: {output_format}')
+        self.output_format = output_format
+        self.separated = separated
+        self.blocks = []
+
+    def section(self, title, as_list=False, **data):
+        """
+        Adds a section, the next items going into it
+        """
+        self.blocks.append({'type': 'section', 'title': title, 'as_list': as_list,
+            'items': [], **data})
+
+    def item(self, label, text, color='plain', **data):
+        """
+        Adds an item to the last section
+        """
+        self.blocks[-1]['items'].append({'label': label, 'text': text, 'color': color, **data})
+
+    def table(self, headers, rows):
+        """
+        Adds a table
+        """
+        self.blocks.append({'type': 'table', 'headers': headers, 'rows': rows})
+
+    def render(self):
+        """
+        Returns the document in the output format
+        """
+        if self.output_format == 'json':
+            return json.dumps({'blocks': self.blocks}, ensure_ascii=False) + '\n'
+        is_html = self.output_format == 'html'
+        escape_text = escape_html if is_html else str
+        templates = COMPILED[self.output_format]
+        buffer = [templates['begin']()]
+        if self.separated:
+            buffer.append(templates['separator']())
+        for block in self.blocks:
+            if block['type'] == 'table':
+                buffer.append(tabulate(block['rows'], block['headers'],
+                    tablefmt='html' if is_html else 'simple', disable_numparse=True) + '\n')
+                continue
+            if block['as_list']:
+                buffer.append(templates['list_begin']())
+            buffer.append(templates['title'](title=escape_text(block['title'])))
+            for item in block['items']:
+                buffer.append(templates['item'](label=escape_text(item['label']),
+                    text=templates[item['color']](text=escape_text(item['text']))))
+            if block['as_list']:
+                buffer.append(templates['list_end']())
+        buffer.append(templates['end']())
+        return ''.join(buffer)
+
+    def write(self, output=None):
+        """
+        Writes the document to the output (=stdout) in one call
+        """
+        output = output or sys.stdout
+        output.write(self.render())
+        output.flush()
@@ -14,64 +14,141 @@ from lib import cache, common
 # Debug
 # from pdb import set_trace as st
 
-def get_cours(isin, mic, disable_cache=False):
+FIELDS = [
+    'DISPLAY_NAME', 'EVENT3', 'ISIN', 'LISTING_ID', 'M_CUR', 'M_PRICINGQUOT:id', 'M_SYMB',
+    'MARKET', 'MIC', 'SC_GROUPED', 'MARKET:id', 'MARKET:description', 'SEC:id', 'SEC:description',
+    'SRD', 'TAXFR_PEA_APP', 'TAXFR_PEA', '12W_AVVOL', 'HIGH', 'LOW', 'LVAL_NORM', 'MCAP_TK',
+    'NC2_PR_NORM', 'OPEN', 'CLOSE_ADJ_NORM', 'VOL', 'CAPEX_RATIO', 'TUR', 'INTEREST', 'DENOM',
+    'MATURITY', 'EUSIPA:description', 'ISSUEDATE', 'EXERRATIO', 'STRIKE', 'COMPFULLNAME',
+    '1W_PERF_PR', '4W_PERF_PR', '12W_PERF_PR', '26W_PERF_PR', '52W_PERF_PR', 'YTD_PERF_PR',
+    '3Y_PERF_PR', '5Y_PERF_PR', 'HILIMIT', 'LOLIMIT', 'MM100', 'MM20', 'MM50', 'RESISTANCE_1',
+    'RSI14', 'SUPPORT_1', 'O_SHS', 'ANDISTR', 'YLDEQ', 'DIVIDEND', 'PER_1', 'CA_ANNEE_COURANTE',
+    'ANC_PAR_ACTION_ANNEE_PRECEDENTE', 'BNPA_ANNEE_COURANTE', 'BNPA_ANNEE_N2',
+    'BNPA_ANNEE_PRECEDENTE', 'CA_ANNEE_N2', 'CA_ANNEE_PRECEDENTE', 'CAPI_CA_ANNEE_COURANTE',
+    'CAPI_CA_ANNEE_PRECEDENTE', 'CAPI_CA_ANNEE_SUIVANTE', 'CONSEIL_CONSENSUS_ACHAT',
+    'CONSEIL_CONSENSUS_NEUTRE', 'CONSEIL_CONSENSUS_VENTE', 'CROISSANCE_BNPA_ANNEE_COURANTE',
+    'CROISSANCE_BNPA_ANNEE_PRECEDENTE', 'CROISSANCE_BNPA_ANNEE_SUIVANTE',
+    'CROISSANCE_BNPA_ANNEEN2', 'CROISSANCE_BNPA_MOYEN_3_ANS', 'CROISSANCE_CA_ANNEE_COURANTE',
+    'CROISSANCE_CA_ANNEE_PRECEDENTE', 'CROISSANCE_CA_ANNEE_SUIVANTE', 'CROISSANCE_CA_MOYEN_3_ANS',
+    'CROISSANCE_CA_ANNEEN2', 'DECOTE_SURCOTE', 'DIV_ANNEE_COURANTE', 'DIV_ANNEE_PRECEDENTE',
+    'ENDETTEMENT_NET_FP', 'ENDETTEMENT_NET', 'FONDS_PROPRES', 'PER_ANNEE_ESTIMEE',
+    'PER_ANNEE_PRECEDENTE', 'PER_ANNEE_SUIVANTE', 'RDT_NET_ANNEE_COURANTE', 'SCAN_NOTE_BNPA',
+    'SCAN_NOTE_CA', 'SCAN_NOTE_GLOBALE', 'SCAN_NOTE_PERF', 'SCAN_NOTE_RDT',
+    'SCAN_NOTE_SOLIDITE_BILAN', 'SCAN_RANK_BNPA', 'SCAN_RANK_CA', 'SCAN_RANK_GLOBALE',
+    'SCAN_RANK_PERF', 'SCAN_RANK_RDT', 'SCAN_RANK_SOLIDITE_BILAN', 'VESUR_CA_ANNEE_COURANTE',
+]
+
+# Fields requested by each consumer of get_cours
+PROFILES = {
+    'dashboard': ['DISPLAY_NAME', 'LVAL_NORM', 'NC2_PR_NORM'],
+    'report': [
+        'DISPLAY_NAME', 'ISIN', 'M_CUR', 'SEC:id', 'SEC:description', 'LVAL_NORM', 'NC2_PR_NORM',
+        '52W_PERF_PR', 'DIVIDEND', 'DIV_ANNEE_PRECEDENTE', 'CROISSANCE_BNPA_ANNEEN2',
+        'CROISSANCE_BNPA_ANNEE_PRECEDENTE', 'CROISSANCE_BNPA_ANNEE_COURANTE',
+        'CROISSANCE_CA_ANNEEN2', 'CROISSANCE_CA_ANNEE_PRECEDENTE', 'CROISSANCE_CA_ANNEE_COURANTE',
+        'PER_ANNEE_ESTIMEE', 'PER_ANNEE_PRECEDENTE',
+    ],
+    'full': FIELDS,
+}
+
+def get_url(isin, mic, profile):
     """
-    Returns core info from isin
+    Returns the url of the quote, requesting the fields of the profile
     """
-    url = common.decode_rot('uggcf://yrfrpubfcek.fbyhgvbaf.jrost.pu/zqc-nhgu/yrfrpubf-ncv/') + \
-        f'quotes/{isin}-{mic}?keytype=ISIN_MIC&fields=DISPLAY_NAME,EVENT3,ISIN,LISTING_ID,M_CUR,M_PRICINGQUOT:id,M_SYMB,MARKET,MIC,SC_GROUPED,MARKET:id,MARKET:description,SEC:id,SEC:description,SRD,TAXFR_PEA_APP,TAXFR_PEA,12W_AVVOL,HIGH,LOW,LVAL_NORM,MCAP_TK,NC2_PR_NORM,OPEN,CLOSE_ADJ_NORM,VOL,CAPEX_RATIO,TUR,INTEREST,DENOM,MATURITY,EUSIPA:description,ISSUEDATE,EXERRATIO,STRIKE,COMPFULLNAME,1W_PERF_PR,4W_PERF_PR,12W_PERF_PR,26W_PERF_PR,52W_PERF_PR,YTD_PERF_PR,3Y_PERF_PR,5Y_PERF_PR,HILIMIT,LOLIMIT,MM100,MM20,MM50,RESISTANCE_1,RSI14,SUPPORT_1,O_SHS,ANDISTR,YLDEQ,DIVIDEND,PER_1,CA_ANNEE_COURANTE,ANC_PAR_ACTION_ANNEE_PRECEDENTE,BNPA_ANNEE_COURANTE,BNPA_ANNEE_N2,BNPA_ANNEE_PRECEDENTE,CA_ANNEE_N2,CA_ANNEE_PRECEDENTE,CAPI_CA_ANNEE_COURANTE,CAPI_CA_ANNEE_PRECEDENTE,CAPI_CA_ANNEE_SUIVANTE,CONSEIL_CONSENSUS_ACHAT,CONSEIL_CONSENSUS_NEUTRE,CONSEIL_CONSENSUS_VENTE,CROISSANCE_BNPA_ANNEE_COURANTE,CROISSANCE_BNPA_ANNEE_PRECEDENTE,CROISSANCE_BNPA_ANNEE_SUIVANTE,CROISSANCE_BNPA_ANNEEN2,CROISSANCE_BNPA_MOYEN_3_ANS,CROISSANCE_CA_ANNEE_COURANTE,CROISSANCE_CA_ANNEE_PRECEDENTE,CROISSANCE_CA_ANNEE_SUIVANTE,CROISSANCE_CA_MOYEN_3_ANS,CROISSANCE_CA_ANNEEN2,DECOTE_SURCOTE,DIV_ANNEE_COURANTE,DIV_ANNEE_PRECEDENTE,ENDETTEMENT_NET_FP,ENDETTEMENT_NET,FONDS_PROPRES,PER_ANNEE_ESTIMEE,PER_ANNEE_PRECEDENTE,PER_ANNEE_SUIVANTE,RDT_NET_ANNEE_COURANTE,SCAN_NOTE_BNPA,SCAN_NOTE_CA,SCAN_NOTE_GLOBALE,SCAN_NOTE_PERF,SCAN_NOTE_RDT,SCAN_NOTE_SOLIDITE_BILAN,SCAN_RANK_BNPA,SCAN_RANK_CA,SCAN_RANK_GLOBALE,SCAN_RANK_PERF,SCAN_RANK_RDT,SCAN_RANK_SOLIDITE_BILAN,VESUR_CA_ANNEE_COURANTE'
-    content = cache.get(url, disable_cache=disable_cache)
-    cours = None
-    if content:
-        cours = common.clean_data(content)['fields']
-    return cours
+    return common.decode_rot('uggcf://yrfrpubfcek.fbyhgvbaf.jrost.pu/zqc-nhgu/yrfrpubf-ncv/') + \
+        f'quotes/{isin}-{mic}?keytype=ISIN_MIC&fields=' + ','.join(PROFILES[profile])
+
+def get_wider_profiles(profile):
+    """
+    Returns the other profiles requesting at least the fields of the profile, narrowest first
+    """
+    fields = set(PROFILES[profile])
+    wider_profiles = [name for name in PROFILES \
+        if name != profile and fields <= set(PROFILES[name])]
+    return sorted(wider_profiles, key=lambda name: len(PROFILES[name]))
+
+def project(cours, profile):
+    """
+    Returns the fields of the cours requested by the profile
+    """
+    names = {field.split(':')[0] for field in PROFILES[profile]}
+    return {name: value for name, value in cours.items() if name in names}
+
+def parse_cours(content):
+    """
+    Returns the fields of the quote response
+    """
+    return common.clean_data(content)['fields']
+
+def get_cours(isin, mic, disable_cache=False, profile='full', stale=False):
+    """
+    Returns core info from isin, limited to the fields of the profile.
+    A wider profile in cache serves a narrower one.
+    With stale, an expired quote in cache is returned and refreshed in the background.
+    """
+    if not disable_cache:
+        for wider_profile in get_wider_profiles(profile):
+            cours = cache.peek_parsed(get_url(isin, mic, wider_profile), parse_cours)
+            if cours is not None:
+                return project(cours, profile)
+    return cache.get_parsed(get_url(isin, mic, profile), parse_cours, disable_cache=disable_cache,
+        stale=stale)
+
+# Derived metrics computed by get_report, in their report order:
+# name -> (numerator field, denominator field, factor, value when the denominator is 0)
+# The metric is factor * numerator / denominator rounded to 1 decimal,
+# '-' when a field is missing.
+DERIVED_METRICS = {
+    'CUSTOM_DIVIDEND_PERCENT': ('DIVIDEND', 'LVAL_NORM', 100, '-'),
+    'CUSTOM_DIVIDEND_ANNEE_PRECEDENTE_PERCENT': ('DIV_ANNEE_PRECEDENTE', 'LVAL_NORM', 100, '-'),
+    'CUSTOM_PEG': ('PER_ANNEE_ESTIMEE', 'CROISSANCE_BNPA_ANNEE_COURANTE', 1, 'infini'),
+    'CUSTOM_PEG_ANNEE_PRECEDENTE': ('PER_ANNEE_PRECEDENTE', 'CROISSANCE_BNPA_ANNEE_PRECEDENTE',
+        1, 'infini'),
+    'CUSTOM_PEG_MAISON': ('PER_ANNEE_ESTIMEE', '52W_PERF_PR', 1, 'infini'),
+}
+
+def get_column(reports, field):
+    """
+    Returns the 'v' values of the field in the reports, None when missing
+    """
+    column = []
+    for report in reports:
+        entry = report[field] if field in report else None
+        column.append(entry['v'] if isinstance(entry, dict) else None)
+    return column
+
+def derive_column(numerators, denominators, factor, zero_value):
+    """
+    Returns the metric column of the numerator and denominator columns
+    """
+    return [
+        '-' if numerator is None or denominator is None else
+        zero_value if denominator == 0 else
+        round(factor*numerator/denominator, 1)
+        for numerator, denominator in zip(numerators, denominators)]
+
+def compute_derived(reports):
+    """
+    Computes column-wise the derived metrics of the reports (dicts or Quotes), in place
+    """
+    columns = {}
+    for name, (numerator, denominator, factor, zero_value) in DERIVED_METRICS.items():
+        for field in (numerator, denominator):
+            if field not in columns:
+                columns[field] = get_column(reports, field)
+        metric = derive_column(columns[numerator], columns[denominator], factor, zero_value)
+        for report, value in zip(reports, metric):
+            report[name] = value
+    return reports
 
 def get_report(parameters):
     """
     Returns a report of all metadata from the input ISIN
     """
-    report = get_cours(parameters['isin'], parameters['mic'])
+    report = get_cours(parameters['isin'], parameters['mic'],
+        profile=parameters.get('profile', 'full'), stale=parameters.get('stale', False))
 
     if report is None:
         return None
-    report['CUSTOM_DIVIDEND_PERCENT'] = '-'
-    if 'DIVIDEND' in report and 'LVAL_NORM' in report:
-        dividend = report['DIVIDEND']['v']
-        cur_value = report['LVAL_NORM']['v']
-        report['CUSTOM_DIVIDEND_PERCENT'] = '-'
-        if cur_value != 0:
-            report['CUSTOM_DIVIDEND_PERCENT'] = round(100*dividend/cur_value, 1)
-
-    report['CUSTOM_DIVIDEND_ANNEE_PRECEDENTE_PERCENT'] = '-'
-    if 'DIV_ANNEE_PRECEDENTE' in report and 'LVAL_NORM' in report:
-        dividend = report['DIV_ANNEE_PRECEDENTE']['v']
-        cur_value = report['LVAL_NORM']['v']
-        report['CUSTOM_DIVIDEND_ANNEE_PRECEDENTE_PERCENT'] = '-'
-        if cur_value != 0:
-            report['CUSTOM_DIVIDEND_ANNEE_PRECEDENTE_PERCENT'] = round(100*dividend/cur_value, 1)
-
-    report['CUSTOM_PEG'] = '-'
-    if 'CROISSANCE_BNPA_ANNEE_COURANTE' in report and 'PER_ANNEE_ESTIMEE' in report:
-        croissance = report['CROISSANCE_BNPA_ANNEE_COURANTE']['v']
-        per = report['PER_ANNEE_ESTIMEE']['v']
-        report['CUSTOM_PEG'] = 'infini'
-        if croissance != 0:
-            report['CUSTOM_PEG'] = round(per/croissance, 1)
-
-    report['CUSTOM_PEG_ANNEE_PRECEDENTE'] = '-'
-    if 'CROISSANCE_BNPA_ANNEE_PRECEDENTE' in report and 'PER_ANNEE_PRECEDENTE' in report:
-        croissance = report['CROISSANCE_BNPA_ANNEE_PRECEDENTE']['v']
-        per = report['PER_ANNEE_PRECEDENTE']['v']
-        report['CUSTOM_PEG_ANNEE_PRECEDENTE'] = 'infini'
-        if croissance != 0:
-            report['CUSTOM_PEG_ANNEE_PRECEDENTE'] = round(per/croissance, 1)
-
-    report['CUSTOM_PEG_MAISON'] = '-'
-    if '52W_PERF_PR' in report and 'PER_ANNEE_ESTIMEE' in report:
-        croissance = report['52W_PERF_PR']['v']
-        per = report['PER_ANNEE_ESTIMEE']['v']
-        report['CUSTOM_PEG_MAISON'] = 'infini'
-        if croissance != 0:
-            report['CUSTOM_PEG_MAISON'] = round(per/croissance, 1)
-
+    compute_derived([report])
     return report
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Screener library
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+from array import array
+from bisect import bisect_left, bisect_right
+from math import isnan
+import re
+
+# Own library
+# pylint: disable=E0401
+from lib import quote
+
+# Debug
+# from pdb import set_trace as st
+
+# Query: 'FIELD OP NUMBER [and FIELD OP NUMBER ...] [sort FIELD [asc|desc]] [top N]'
+# e.g. 'PER_ANNEE_ESTIMEE < 12 and CUSTOM_DIVIDEND_PERCENT > 4 sort CUSTOM_DIVIDEND_PERCENT desc top 10'
+
+CONDITION_PATTERN = re.compile(r'([A-Za-z0-9_]+)\s*(<=|>=|==|!=|<|>)\s*([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)$')
+SORT_PATTERN = re.compile(r'\s+sort\s+([A-Za-z0-9_]+)(?:\s+(asc|desc))?', re.IGNORECASE)
+TOP_PATTERN = re.compile(r'\s+top\s+([0-9]+)', re.IGNORECASE)
+
+def parse_query(text):
+    """
+    Returns the conditions [(field, operator, value)], the sort (field, descending)
+    or None and the top N (0 = all) of the query, raises ValueError if invalid
+    """
+    text = f' {text.strip()} '
+    sort = None
+    match = SORT_PATTERN.search(text)
+    if match:
+        sort = (match.group(1), (match.group(2) or 'asc').lower() == 'desc')
+        text = text[:match.start()] + ' ' + text[match.end():]
+    top = 0
+    match = TOP_PATTERN.search(text)
+    if match:
+        top = int(match.group(1))
+        text = text[:match.start()] + ' ' + text[match.end():]
+    conditions = []
+    if text.strip():
+        for condition in re.split(r'\s+and\s+', text.strip(), flags=re.IGNORECASE):
+            match = CONDITION_PATTERN.match(condition.strip())
+            if not match:
+                raise ValueError(f'Invalid condition: {condition.strip()}')
+            try:
+                value = float(match.group(3))
+            except ValueError as err:
+                raise ValueError(f'Invalid number: {match.group(3)}') from err
+            conditions.append((match.group(1), match.group(2), value))
+    return conditions, sort, top
+
+def get_value(report, field):
+    """
+    Returns the numeric value of the field in the report, None if missing or not a number
+    """
+    entry = report.get(field)
+    if isinstance(entry, dict):
+        entry = entry.get('v')
+    if quote.is_number(entry) and not isnan(entry):
+        return float(entry)
+    return None
+
+class Screener:
+    """
+    Range queries and sorts over the numeric fields of a snapshot. Each field gets,
+    on its first use, a sorted column of its values and the matching report
+    positions, so that a condition is two bisections and a sort a walk of the column.
+    """
+    def __init__(self, reports):
+        self.reports = list(reports)
+        self.columns = {}
+
+    def get_column(self, field):
+        """
+        Returns the sorted values of the field and their report positions
+        """
+        if field not in self.columns:
+            pairs = []
+            for position, report in enumerate(self.reports):
+                value = get_value(report, field)
+                if value is not None:
+                    pairs.append((value, position))
+            pairs.sort()
+            self.columns[field] = (array('d', [value for value, _ in pairs]),
+                array('l', [position for _, position in pairs]))
+        return self.columns[field]
+
+    def select(self, field, operator, value):
+        """
+        Returns the positions of the reports matching the condition
+        """
+        values, positions = self.get_column(field)
+        left = bisect_left(values, value)
+        right = bisect_right(values, value)
+        if operator == '<':
+            return set(positions[:left])
+        if operator == '<=':
+            return set(positions[:right])
+        if operator == '>':
+            return set(positions[right:])
+        if operator == '>=':
+            return set(positions[left:])
+        if operator == '==':
+            return set(positions[left:right])
+        return set(positions[:left]) | set(positions[right:])
+
+    def screen(self, conditions, sort=None, top=0):
+        """
+        Returns the reports matching all the conditions, sorted by the sort
+        field (ones without it last) or in snapshot order, the top N ones if set
+        """
+        selected = None
+        for field, operator, value in conditions:
+            matches = self.select(field, operator, value)
+            selected = matches if selected is None else selected & matches
+            if not selected:
+                return []
+        if selected is None:
+            selected = set(range(len(self.reports)))
+        if sort is None:
+            order = sorted(selected)
+        else:
+            _, positions = self.get_column(sort[0])
+            if sort[1]:
+                positions = reversed(positions)
+            order = []
+            for position in positions:
+                if position in selected:
+                    order.append(position)
+                    if len(order) == top:
+                        break
+            if len(order) < len(selected) and len(order) != top:
+                # Reports without the sort field
+                order.extend(sorted(selected.difference(order)))
+        if top:
+            order = order[:top]
+        return [self.reports[position] for position in order]
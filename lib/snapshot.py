@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Snapshot library
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+import json
+import os
+from pathlib import Path
+import re
+
+# Own library
+# pylint: disable=E0401
+from lib import store
+
+# Debug
+# from pdb import set_trace as st
+
+# A daily snapshot 'YYYY_MM_DD.txt' holds one JSON report per line. Its sidecar
+# index 'YYYY_MM_DD.txt.idx' maps each ISIN to the [offset, length] of its line,
+# for the first 'size' bytes of the snapshot, and counts its delta lines.
+# A delta line only holds the fields changed since the full line of the ISIN
+# in its keyframe, a previous snapshot of the same directory:
+# {"isin": ..., "_keyframe": "YYYY_MM_DD.txt", "_changed": {...}, "_removed": [...]}
+
+ISIN_PATTERN = re.compile(rb'"isin": "((?:[^"\\]|\\.)*)"')
+DELTA_MARKER = b'"_keyframe": '
+
+def get_index_path(path):
+    """
+    Returns the path of the sidecar index of the snapshot
+    """
+    path = Path(path)
+    return path.with_name(f'{path.name}.idx')
+
+def get_journal_path(path):
+    """
+    Returns the path of the journal of the snapshot being written
+    """
+    path = Path(path)
+    return path.with_name(f'{path.name}.part')
+
+def get_line_isin(line):
+    """
+    Returns the ISIN of the report line, None if invalid
+    """
+    match = ISIN_PATTERN.search(line)
+    if match:
+        return json.loads(b'"' + match.group(1) + b'"')
+    try:
+        return json.loads(line).get('isin')
+    except (ValueError, AttributeError):
+        return None
+
+def scan_offsets(snapshot_file, offsets, start):
+    """
+    Adds the [offset, length] of each ISIN line from the start offset, the last one winning,
+    returns the end offset and the number of delta lines
+    """
+    snapshot_file.seek(start)
+    offset = start
+    deltas = 0
+    for line in snapshot_file:
+        isin = get_line_isin(line) if line.endswith(b'\n') else None
+        if isin is not None:
+            offsets[isin] = [offset, len(line)]
+            deltas += DELTA_MARKER in line
+        offset += len(line)
+    return offset, deltas
+
+def read_index(path):
+    """
+    Returns the sidecar index of the snapshot, None if absent or invalid
+    """
+    try:
+        index = json.loads(get_index_path(path).read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        return None
+    if index.get('size', 0) > Path(path).stat().st_size:
+        return None
+    return index
+
+def write_index(path):
+    """
+    Writes the sidecar index of the snapshot, extending the existing one
+    """
+    index = read_index(path)
+    if index is None or 'deltas' not in index:
+        index = {'size': 0, 'isins': {}, 'deltas': 0}
+    with Path(path).open('rb') as snapshot_file:
+        index['size'], deltas = scan_offsets(snapshot_file, index['isins'], index['size'])
+    index['deltas'] += deltas
+    store.write_atomic(get_index_path(path), json.dumps(index).encode('utf-8'))
+    return index
+
+def is_keyframe(path):
+    """
+    Returns True if the snapshot has no delta line
+    """
+    index = read_index(path)
+    if index is None or 'deltas' not in index or index['size'] != Path(path).stat().st_size:
+        index = write_index(path)
+    return index['deltas'] == 0
+
+def get_keyframe(report_path, interval):
+    """
+    Returns the keyframe of the next deltas of the directory of the report path:
+    the last full snapshot before it, None if older than interval snapshots
+    """
+    report_path = Path(report_path)
+    previous = [path for path in sorted(report_path.parent.glob('*.txt')) \
+        if path.name < report_path.name]
+    candidates = previous[-(interval - 1):] if interval > 1 else []
+    for path in reversed(candidates):
+        if is_keyframe(path):
+            return path
+    return None
+
+def encode_delta(report, keyframe_name, keyframe_report):
+    """
+    Returns the delta of the report against the report of the keyframe
+    """
+    return {
+        'isin': report['isin'],
+        '_keyframe': keyframe_name,
+        '_changed': {name: value for name, value in report.items() \
+            if name != 'isin' and keyframe_report.get(name) != value},
+        '_removed': [name for name in keyframe_report if name not in report],
+    }
+
+def apply_delta(keyframe_report, delta):
+    """
+    Returns the report rebuilt from the report of the keyframe and the delta
+    """
+    report = dict(keyframe_report)
+    for name in delta['_removed']:
+        report.pop(name, None)
+    report.update(delta['_changed'])
+    report['isin'] = delta['isin']
+    return report
+
+def iter_lines(path, isins=None):
+    """
+    Yields the lines of the snapshot lazily as stored, only the ones of the isins if set,
+    skipping the invalid ones. With a sidecar index, each one is a seek and one decode.
+    """
+    path = Path(path)
+    index = read_index(path) if isins is not None else None
+    with path.open('rb') as snapshot_file:
+        if index is not None:
+            offsets = dict(index['isins'])
+            # Lines appended after the index was written
+            scan_offsets(snapshot_file, offsets, index['size'])
+            lines = []
+            for isin in isins:
+                if isin in offsets:
+                    snapshot_file.seek(offsets[isin][0])
+                    lines.append(snapshot_file.read(offsets[isin][1]))
+        else:
+            wanted = None if isins is None else set(isins)
+            # A line without its newline is the partial write of a crash
+            lines = (line for line in snapshot_file if line.endswith(b'\n') \
+                and (wanted is None or get_line_isin(line) in wanted))
+        for line in lines:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(report, dict) and 'isin' in report:
+                yield report
+
+def iter_reports(path, isins=None):
+    """
+    Yields the reports of the snapshot lazily, only the ones of the isins if set,
+    rebuilding the delta lines from their keyframe
+    """
+    path = Path(path)
+    keyframes = {}
+    for report in iter_lines(path, isins=isins):
+        if '_keyframe' not in report:
+            yield report
+            continue
+        name = report['_keyframe']
+        if name not in keyframes:
+            # The whole keyframe, or the requested ISIN only, loaded once
+            keyframes[name] = {keyframe_report['isin']: keyframe_report \
+                for keyframe_report in iter_lines(path.with_name(name), isins=isins)}
+        yield apply_delta(keyframes[name].get(report['isin'], {}), report)
+
+class SnapshotWriter:
+    """
+    Writer of a daily snapshot, resuming the lines already saved in it.
+    The lines are buffered and appended by batch to the journal 'YYYY_MM_DD.txt.part',
+    then, on close, the snapshot and its index are rewritten atomically with the saved
+    and the new lines, one per ISIN in the order of the isins (the other ones last),
+    and the journal removed.
+    """
+    def __init__(self, path, batch_size=50, order=()):
+        self.path = Path(path)
+        self.journal_path = get_journal_path(path)
+        self.batch_size = batch_size
+        self.positions = {isin: position for position, isin in enumerate(order)}
+        self.buffer = []
+        # Encoded line by ISIN, the last one winning
+        self.lines = {}
+        for saved_path in (self.path, self.journal_path):
+            if saved_path.exists():
+                for report in iter_lines(saved_path):
+                    self.lines[report['isin']] = json.dumps(report)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __contains__(self, isin):
+        return isin in self.lines
+
+    def add(self, line):
+        """
+        Adds the line (report or delta) of an ISIN
+        """
+        encoded = json.dumps(line)
+        self.lines[line['isin']] = encoded
+        self.buffer.append(encoded + '\n')
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the buffered lines to the journal
+        """
+        if not self.buffer:
+            return
+        is_new = not self.journal_path.exists()
+        with self.journal_path.open('a', encoding='utf-8') as journal_file:
+            journal_file.write(''.join(self.buffer))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        if is_new:
+            store.fsync_directory(self.journal_path.parent)
+        self.buffer = []
+
+    def close(self):
+        """
+        Writes the snapshot and its index, removes the journal
+        """
+        self.flush()
+        if not self.lines:
+            return
+        index = {'size': 0, 'isins': {}, 'deltas': 0}
+        content = []
+        # Stable sort: the ISIN out of the order keep their saving order
+        last = len(self.positions)
+        for isin in sorted(self.lines, key=lambda isin: self.positions.get(isin, last)):
+            line = (self.lines[isin] + '\n').encode('utf-8')
+            index['isins'][isin] = [index['size'], len(line)]
+            index['size'] += len(line)
+            index['deltas'] += DELTA_MARKER in line
+            content.append(line)
+        index_path = get_index_path(self.path)
+        if index_path.exists():
+            index_path.unlink()
+        # The snapshot must be on the disk before the journal goes away
+        store.write_atomic(self.path, b''.join(content), durable=True)
+        store.write_atomic(index_path, json.dumps(index).encode('utf-8'))
+        if self.journal_path.exists():
+            self.journal_path.unlink()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Cache store library
+
+Copyright (c) 2020-2024 Nicolas Beguier
+Licensed under the MIT License
+Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
+"""
+
+# Standard library imports
+from collections import OrderedDict
+import json
+import os
+from pathlib import Path
+import threading
+import time
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# Debug
+# from pdb import set_trace as st
+
+# HTTP validators stored with the entries, for conditional requests
+VALIDATORS = ('etag', 'last_modified')
+
+def fsync_directory(directory):
+    """
+    Flushes the entries of the directory (creations, renames, removals) to the disk
+    """
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_atomic(path, content, durable=False):
+    """
+    Writes the bytes content to the path through a temporary file renamed over it,
+    so that readers never see a half-written file. If durable, the content is
+    on the disk before the rename, and the rename before returning.
+    """
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with tmp_path.open('wb') as tmp_file:
+            tmp_file.write(content)
+            if durable:
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+        if durable:
+            fsync_directory(path.parent)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+def select_evicted(entries, max_entries, max_bytes, now, stale_max_age=0):
+    """
+    Returns the keys to remove among the (created, ttl, size, key, has_validators) entries:
+    the expired ones that can neither be served stale (within ttl + stale_max_age)
+    nor revalidated, then the oldest ones until the limits are respected.
+    A limit of 0 means unlimited.
+    """
+    evicted = []
+    kept = []
+    for entry in sorted(entries):
+        if now - entry[0] > entry[1] + stale_max_age and not entry[4]:
+            evicted.append(entry[3])
+        else:
+            kept.append(entry)
+    count = len(kept)
+    size = sum(entry[2] for entry in kept)
+    for entry in kept:
+        if (not max_entries or count <= max_entries) and (not max_bytes or size <= max_bytes):
+            break
+        evicted.append(entry[3])
+        count -= 1
+        size -= entry[2]
+    return evicted
+
+def summarize(entries, counters, now):
+    """
+    Returns the statistics of the (created, ttl, size, key, has_validators) entries
+    """
+    lookups = counters.get('hits', 0) + counters.get('misses', 0)
+    return {
+        'entries': len(entries),
+        'bytes': sum(entry[2] for entry in entries),
+        'expired': sum(1 for entry in entries if now - entry[0] > entry[1]),
+        'hits': counters.get('hits', 0),
+        'misses': counters.get('misses', 0),
+        'hit_ratio': counters.get('hits', 0) / lookups if lookups else 0,
+    }
+
+class MemoryStore:
+    """
+    Bounded in-process LRU of values, each one with its own expiration,
+    limited in number of entries and in bytes
+    """
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value of the key, None if absent or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() >= entry[2]:
+                self.remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size, expires):
+        """
+        Stores the value of the key until the expires timestamp,
+        only removing the previous one if the value does not fit
+        """
+        with self.lock:
+            self.remove(key)
+            if size > self.max_bytes or self.max_entries <= 0:
+                return
+            self.entries[key] = (value, size, expires)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        """
+        Removes the key
+        """
+        with self.lock:
+            self.remove(key)
+
+    def remove(self, key):
+        """
+        Removes the key, the lock being held
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        """
+        Removes all the entries
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns the counters of the memory store
+        """
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size,
+                'hits': self.hits, 'misses': self.misses}
+
+class SqliteStore:
+    """
+    Cache entries indexed by key in a single SQLite database,
+    with their creation timestamp and TTL
+    """
+    def __init__(self, directory):
+        self.path = Path(directory) / 'cache.sqlite'
+        self.local = threading.local()
+
+    def connection(self):
+        """
+        Returns the connection of the current thread
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            # WAL lets readers go on while another process writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, created REAL NOT NULL, ttl INTEGER NOT NULL, '
+                'content BLOB NOT NULL)')
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(cache)')]
+            for column in VALIDATORS:
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE cache ADD COLUMN {column} TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_created ON cache (created)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters ('
+                'name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        """
+        Returns the entry of the key, None if absent
+        """
+        row = self.connection().execute(
+            'SELECT content, created, ttl FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return {'content': bytes(row[0]), 'created': row[1], 'ttl': row[2]}
+
+    def set(self, key, content, ttl, validators=None):
+        """
+        Stores the content of the key, with its HTTP validators
+        """
+        validators = validators or {}
+        conn = self.connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO cache '
+                '(key, created, ttl, content, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, time.time(), ttl, content,
+                    validators.get('etag'), validators.get('last_modified')))
+
+    def validators(self, key):
+        """
+        Returns the HTTP validators of the key
+        """
+        row = self.connection().execute(
+            'SELECT etag, last_modified FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return {}
+        return {name: value for name, value in zip(VALIDATORS, row) if value}
+
+    def touch(self, key):
+        """
+        Renews the creation timestamp of the key
+        """
+        conn = self.connection()
+        with conn:
+            conn.execute('UPDATE cache SET created = ? WHERE key = ?', (time.time(), key))
+
+    def delete(self, key):
+        """
+        Removes the key
+        """
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def entries(self):
+        """
+        Returns the (created, ttl, size, key, has_validators) of all the entries
+        """
+        return self.connection().execute(
+            'SELECT created, ttl, length(content), key, '
+            '(etag IS NOT NULL OR last_modified IS NOT NULL) FROM cache').fetchall()
+
+    def add_counters(self, counters):
+        """
+        Adds the lookup counters to the stored ones
+        """
+        conn = self.connection()
+        with conn:
+            for name, value in counters.items():
+                conn.execute('INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)', (name,))
+                conn.execute('UPDATE counters SET value = value + ? WHERE name = ?', (value, name))
+
+    def stats(self):
+        """
+        Returns the statistics of the store
+        """
+        counters = dict(self.connection().execute('SELECT name, value FROM counters').fetchall())
+        return summarize(self.entries(), counters, time.time())
+
+    def prune(self, max_entries, max_bytes, stale_max_age=0):
+        """
+        Removes the expired entries not usable anymore, then the oldest ones above
+        the limits, returns the number of removed entries
+        """
+        evicted = select_evicted(self.entries(), max_entries, max_bytes, time.time(),
+            stale_max_age)
+        conn = self.connection()
+        with conn:
+            conn.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in evicted])
+        return len(evicted)
+
+    def clear(self):
+        """
+        Removes all the entries and counters
+        """
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM cache')
+            conn.execute('DELETE FROM counters')
+        conn.execute('VACUUM')
+
+class FileStore:
+    """
+    Cache entries stored as one file per key, the modification time being
+    the creation timestamp. A '<key>.meta' sidecar holds the HTTP validators
+    of the entry and its TTL when it differs from the store one.
+    """
+    def __init__(self, directory, ttl):
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    def read_meta(self, key):
+        """
+        Returns the sidecar metadata of the key
+        """
+        try:
+            return json.loads((self.directory / f'{key}.meta').read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, key):
+        """
+        Returns the entry of the key, None if absent
+        """
+        try:
+            with (self.directory / key).open('rb') as cache_file:
+                created = os.fstat(cache_file.fileno()).st_mtime
+                content = cache_file.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return {'content': content, 'created': created,
+            'ttl': self.read_meta(key).get('ttl', self.ttl)}
+
+    def set(self, key, content, ttl, validators=None):
+        """
+        Stores the content of the key, with its HTTP validators and TTL in a sidecar file
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta = dict(validators or {})
+        if ttl != self.ttl:
+            meta['ttl'] = ttl
+        meta_path = self.directory / f'{key}.meta'
+        # The sidecar first, so that the entry is never read with the TTL of a previous one
+        if meta:
+            write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+        elif meta_path.exists():
+            meta_path.unlink()
+        write_atomic(self.directory / key, content)
+
+    def validators(self, key):
+        """
+        Returns the HTTP validators of the key
+        """
+        meta = self.read_meta(key)
+        return {name: meta[name] for name in VALIDATORS if meta.get(name)}
+
+    def touch(self, key):
+        """
+        Renews the creation timestamp of the key
+        """
+        try:
+            os.utime(self.directory / key)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, key):
+        """
+        Removes the key
+        """
+        for path in (self.directory / key, self.directory / f'{key}.meta'):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def entries(self):
+        """
+        Returns the (created, ttl, size, key, has_validators) of all the entries
+        """
+        if not self.directory.is_dir():
+            return []
+        result = []
+        with os.scandir(self.directory) as dir_entries:
+            dir_entries = [dir_entry for dir_entry in dir_entries if dir_entry.is_file()]
+        metas = {dir_entry.name for dir_entry in dir_entries if dir_entry.name.endswith('.meta')}
+        for dir_entry in dir_entries:
+            if '.' in dir_entry.name:
+                continue
+            stat = dir_entry.stat()
+            meta = self.read_meta(dir_entry.name) if f'{dir_entry.name}.meta' in metas else {}
+            result.append((stat.st_mtime, meta.get('ttl', self.ttl), stat.st_size,
+                dir_entry.name, any(meta.get(name) for name in VALIDATORS)))
+        return result
+
+    def read_counters(self):
+        """
+        Returns the stored lookup counters
+        """
+        try:
+            return json.loads((self.directory / '.counters').read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def add_counters(self, counters):
+        """
+        Adds the lookup counters to the stored ones
+        """
+        stored = self.read_counters()
+        for name, value in counters.items():
+            stored[name] = stored.get(name, 0) + value
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.directory / '.counters', json.dumps(stored).encode('utf-8'))
+
+    def stats(self):
+        """
+        Returns the statistics of the store
+        """
+        return summarize(self.entries(), self.read_counters(), time.time())
+
+    def prune(self, max_entries, max_bytes, stale_max_age=0):
+        """
+        Removes the expired entries not usable anymore, then the oldest ones above
+        the limits, returns the number of removed entries
+        """
+        evicted = select_evicted(self.entries(), max_entries, max_bytes, time.time(),
+            stale_max_age)
+        for key in evicted:
+            self.delete(key)
+        return len(evicted)
+
+    def clear(self):
+        """
+        Removes all the entries and counters
+        """
+        for entry in self.entries():
+            self.delete(entry[3])
+        try:
+            (self.directory / '.counters').unlink()
+        except FileNotFoundError:
+            pass
+
+def new_store(backend, directory, ttl):
+    """
+    Returns the cache store of the backend, 'sqlite' or 'file'
+    """
+    if backend == 'sqlite' and sqlite3 is not None:
+        return SqliteStore(directory)
+    return FileStore(directory, ttl)
@@ -9,15 +9,19 @@ Written by Nicolas BEGUIER (nicolas_beguier@hotmail.com)
 
 # Standard library imports
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
 import glob
 import os
 import sys
 from pathlib import Path
 
+# Third party library imports
+from tabulate import tabulate
+
 # Own library
-from lib import analysis, display, reporting
+from lib import analysis, display, history, indicators, quote, render, reporting, screener, \
+    snapshot
 try:
     import settings
 except ImportError:
@@ -47,50 +51,151 @@ def is_different_and_valid(old_report, new_report, key):
             and old_report[key]['v'] != new_report[key]['v'] \
             and old_report[key]['v'] is not None and new_report[key]['v'] is not None
 
-def save_report(output_dir):
+def fetch_report(_isin):
     """
-    Save or display the report on disk
+    Returns the report of the ISIN, with its 'isin' key set
     """
     parameters = {}
-
-    for _isin in settings.ISIN_SAVE:
-        parameters['isin'] = _isin
-        parameters['mic'] = 'XPAR'
-        if ',' in _isin:
-            parameters['isin'] = _isin.split(',', maxsplit=1)[0]
-            parameters['mic'] = _isin.split(',')[1]
+    parameters['isin'] = _isin
+    parameters['mic'] = 'XPAR'
+    if ',' in _isin:
+        parameters['isin'] = _isin.split(',', maxsplit=1)[0]
+        parameters['mic'] = _isin.split(',')[1]
+    try:
         report = reporting.get_report(parameters)
-        if report is None:
-            report = {}
-        report['isin'] = _isin
-        if not output_dir:
-            print(report)
-        else:
-            if not Path(output_dir).is_dir():
-                print(f'{output_dir} is not a directory...')
-                return
-            report_path = Path(f'{output_dir}/{datetime.now().strftime("%Y_%m_%d")}.txt')
-            with report_path.open('a', encoding ='utf-8') as report_file:
-                report_file.write(json.dumps(report)+'\n')
+    except Exception as err: # pylint: disable=broad-except
+        print(f'Error fetching {_isin}: {err}', file=sys.stderr)
+        report = None
+    if report is None:
+        report = {}
+    report['isin'] = _isin
+    return report
 
-def load_report(input_file, display_report=True):
+def save_report(output_dir, workers=1, save_history=False, keyframe_interval=0):
+    """
+    Save or display the report on disk, and in the columnar history if asked.
+    The ISIN already saved today are skipped, the failed ones left for a next run.
+    With a keyframe interval, only the changes since the last full snapshot of
+    the previous keyframe_interval - 1 days are saved.
+    """
+    if not output_dir:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for report in executor.map(fetch_report, settings.ISIN_SAVE):
+                print(report)
+        return
+    if not Path(output_dir).is_dir():
+        print(f'{output_dir} is not a directory...')
+        return
+    date = datetime.now().strftime("%Y_%m_%d")
+    report_path = Path(f'{output_dir}/{date}.txt')
+    keyframe_path = None
+    if keyframe_interval:
+        keyframe_path = snapshot.get_keyframe(report_path, keyframe_interval)
+    keyframe_reports = {}
+    if keyframe_path is not None:
+        for report in snapshot.iter_lines(keyframe_path, isins=settings.ISIN_SAVE):
+            keyframe_reports[report['isin']] = report
+
+    failures = 0
+    with snapshot.SnapshotWriter(report_path, order=settings.ISIN_SAVE) as writer:
+        isin_list = [_isin for _isin in settings.ISIN_SAVE if _isin not in writer]
+        # executor.map yields the reports in the ISIN_SAVE order
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for report in executor.map(fetch_report, isin_list):
+                if len(report) == 1:
+                    # Only the 'isin' key: fetch error or no data
+                    failures += 1
+                elif report['isin'] in keyframe_reports:
+                    writer.add(snapshot.encode_delta(report, keyframe_path.name,
+                        keyframe_reports[report['isin']]))
+                else:
+                    writer.add(report)
+    if failures:
+        print(f'{failures} ISIN not saved, run the save again to fetch them', file=sys.stderr)
+    if save_history and report_path.exists():
+        history.append_day(Path(output_dir) / 'history', date,
+            history.read_daily_file(report_path))
+        indicators.update(Path(output_dir) / 'history')
+
+def show_history(directory, field, isin_list, days):
+    """
+    Display the values of the field over the last days from the columnar history
+    """
+    history_dir = Path(directory) / 'history'
+    if not (history_dir / 'meta.json').exists():
+        print(f'No history in {directory}, run: reporter.py history import {directory}')
+        sys.exit(1)
+    dates, values = history.load_slice(history_dir, field, isins=isin_list or None, days=days)
+    rows = []
+    for index, date in enumerate(dates):
+        rows.append([date] + [values[_isin][index] for _isin in values])
+    print(tabulate(rows, ['Date'] + list(values)))
+
+def show_indicators(directory, isin_list, windows):
+    """
+    Display the technical indicators computed from the columnar history
+    """
+    history_dir = Path(directory) / 'history'
+    if not (history_dir / 'meta.json').exists():
+        print(f'No history in {directory}, run: reporter.py history import {directory}')
+        sys.exit(1)
+    date, values = indicators.update(history_dir, windows=windows)
+    rows = []
+    headers = []
+    for _isin in isin_list or values:
+        if _isin in values:
+            headers = list(values[_isin])
+            rows.append([_isin] + [round(value, 2) for value in values[_isin].values()])
+    print(f'Indicators on {date}')
+    print(tabulate(rows, ['ISIN'] + headers))
+
+def screen_report(path, query, fields):
     """
-    Load and display the report
+    Display the reports of the snapshot (=the last one of a directory) matching the query
+    """
+    if Path(path).is_dir():
+        report_files = sorted(Path(path).glob('*.txt'))
+        if not report_files:
+            print(f'No report in {path}...')
+            sys.exit(1)
+        path = report_files[-1]
+    elif not Path(path).exists():
+        print(f'The specified path: {path} does not exists...')
+        sys.exit(1)
+    try:
+        conditions, sort, top = screener.parse_query(query)
+    except ValueError as err:
+        print(err)
+        sys.exit(1)
+    columns = [field for field, _, _ in conditions]
+    if sort is not None:
+        columns.append(sort[0])
+    columns = list(dict.fromkeys(columns + fields))
+    rows = []
+    for report in screener.Screener(snapshot.iter_reports(path)).screen(conditions, sort, top):
+        name = report.get('DISPLAY_NAME', {})
+        rows.append([report['isin'], name.get('v') if isinstance(name, dict) else name] + \
+            [screener.get_value(report, field) for field in columns])
+    print(f'{len(rows)} ISIN in {path}')
+    print(tabulate(rows, ['ISIN', 'Nom'] + columns))
+
+def load_report(input_file, display_report=True, isins=None):
+    """
+    Load and display the report, only the ISIN of isins if set,
+    kept in memory as compact Quotes
     """
     report = {}
     report_path = Path(input_file)
     if not report_path.exists():
         print(f'The specified path: {input_file} does not exists...')
         sys.exit(1)
-    with report_path.open('r', encoding ='utf-8') as report_file:
-        for line in report_file.readlines():
-            sub_report = json.loads(line)
-            report[sub_report['isin']] = sub_report
-            if display_report:
-                display.print_report(sub_report)
+    for sub_report in snapshot.iter_reports(report_path, isins=isins):
+        report[sub_report['isin']] = quote.Quote.from_report(sub_report)
+        if display_report:
+            display.print_report(sub_report)
     return report
 
-def report_valorisation(old_report, new_report, html_tag):
+def report_valorisation(old_report, new_report, renderer):
     """
     Report the valorisation
     """
@@ -98,193 +203,205 @@ def report_valorisation(old_report, new_report, html_tag):
         evo_valorisation = round(100 * (-1 + \
             float(new_report['LVAL_NORM']['v']) / float(old_report['LVAL_NORM']['v'])), 2)
         sign = get_sign(evo_valorisation)
-        if sign == '+':
-            evo_valorisation = f'{html_tag["green_in"]}{sign}{evo_valorisation} %{html_tag["green_out"]}'
-        else:
-            evo_valorisation = f'{html_tag["red_in"]}{sign}{evo_valorisation} %{html_tag["red_out"]}'
-        print(f'{html_tag["li_in"]}{html_tag["bold_in"]}Evolution valorisation{html_tag["bold_out"]}: {evo_valorisation}{html_tag["li_out"]}')
+        renderer.item('Evolution valorisation', f'{sign}{evo_valorisation} %',
+            color='green' if sign == '+' else 'red', value=evo_valorisation)
         currency = ''
         if 'M_CUR' in new_report:
             currency = ' '+new_report['M_CUR']['v']
-        print(f'{html_tag["li_in"]}{html_tag["bold_in"]}Evolution valorisation{html_tag["bold_out"]}: {old_report["LVAL_NORM"]["v"]} -> {new_report["LVAL_NORM"]["v"]}{currency}{html_tag["li_out"]}')
+        renderer.item('Evolution valorisation',
+            f'{old_report["LVAL_NORM"]["v"]} -> {new_report["LVAL_NORM"]["v"]}{currency}',
+            old=old_report['LVAL_NORM']['v'], new=new_report['LVAL_NORM']['v'])
 
-def report_per(old_report, new_report, html_tag):
+def report_per(old_report, new_report, renderer):
     """
     Report the PER
     """
     if is_different_and_valid(old_report, new_report, 'PER_ANNEE_ESTIMEE'):
         evo_per = round(float(new_report['PER_ANNEE_ESTIMEE']['v']) - float(old_report['PER_ANNEE_ESTIMEE']['v']), 1)
-        evo_per = f'{html_tag["blue_in"]}{get_sign(evo_per)}{evo_per}{html_tag["blue_out"]}'
-        print(f'{html_tag["li_in"]}{html_tag["bold_in"]}Evolution PER{html_tag["bold_out"]}: {evo_per}{html_tag["li_out"]}')
-        print(f'{html_tag["li_in"]}{html_tag["bold_in"]}Evolution PER{html_tag["bold_out"]}: {old_report["PER_ANNEE_ESTIMEE"]["v"]} -> {new_report["PER_ANNEE_ESTIMEE"]["v"]}{html_tag["li_out"]}')
-        if analysis.per_text(old_report['PER_ANNEE_ESTIMEE']['v']) != analysis.per_text(new_report['PER_ANNEE_ESTIMEE']['v']):
-            print(f'{html_tag["li_in"]}{html_tag["bold_in"]}Evolution PER{html_tag["bold_out"]}: {analysis.per_text(old_report["PER_ANNEE_ESTIMEE"]["v"])} -> {analysis.per_text(new_report["PER_ANNEE_ESTIMEE"]["v"])}{html_tag["li_out"]}')
-
-def report_peg(old_report, new_report, html_tag):
+        renderer.item('Evolution PER', f'{get_sign(evo_per)}{evo_per}', color='blue', value=evo_per)
+        renderer.item('Evolution PER',
+            f'{old_report["PER_ANNEE_ESTIMEE"]["v"]} -> {new_report["PER_ANNEE_ESTIMEE"]["v"]}',
+            old=old_report['PER_ANNEE_ESTIMEE']['v'], new=new_report['PER_ANNEE_ESTIMEE']['v'])
+        old_text, new_text = analysis.classify_per(
+            (old_report['PER_ANNEE_ESTIMEE']['v'], new_report['PER_ANNEE_ESTIMEE']['v']))
+        if old_text != new_text:
+            renderer.item('Evolution PER', f'{old_text} -> {new_text}', old=old_text, new=new_text)
+
+def report_peg(old_report, new_report, renderer):
     """
     Report the PEG
     """
     if is_different_and_valid(old_report, new_report, 'peg'):
         evo_peg = round(float(new_report['peg']) - float(old_report['peg']), 1)
-        evo_peg = f'{html_tag["blue_in"]}{get_sign(evo_peg)}{evo_peg}{html_tag["blue_out"]}'
-        print(f'{html_tag["li_in"]}{html_tag["bold_in"]}Evolution PEG{html_tag["bold_out"]}: {evo_peg}{html_tag["li_out"]}')
-        print(f'{html_tag["li_in"]}{html_tag["bold_in"]}Evolution PEG{html_tag["bold_out"]}: {old_report["peg"]} -> {new_report["peg"]}{html_tag["li_out"]}')
+        renderer.item('Evolution PEG', f'{get_sign(evo_peg)}{evo_peg}', color='blue', value=evo_peg)
+        renderer.item('Evolution PEG', f'{old_report["peg"]} -> {new_report["peg"]}',
+            old=old_report['peg'], new=new_report['peg'])
 
-def diff_report(oldest_file, newer_file, isin_compare, is_html):
+def diff_report(oldest_file, newer_file, isin_compare, output_format='text'):
     """
     Compare two report
     """
-    html_tag = {
-        'bold_in': '',
-        'bold_out': '',
-        'h3_in': '',
-        'h3_out': '',
-        'li_in': '',
-        'li_out': '',
-        'red_in': '',
-        'red_out': '',
-        'green_in': '',
-        'green_out': '',
-        'blue_in': '',
-        'blue_out': '',
-    }
-    if is_html:
-        html_tag = {
-            'bold_in': '<b>',
-            'bold_out': '</b>',
-            'h3_in': '<h3>',
-            'h3_out': '</h3>',
-            'li_in': '<li>',
-            'li_out': '</li>',
-            'red_in': '<span style="color: #f00;">',
-            'red_out': '</span>',
-            'green_in': '<span style="color: #18b724;">',
-            'green_out': '</span>',
-            'blue_in': '<span style="color: #007eff;">',
-            'blue_out': '</span>',
-        }
-
-    old_reports = load_report(oldest_file, display_report=False)
-    new_reports = load_report(newer_file, display_report=False)
-
-    if is_html:
-        print('<html><body>')
-    else:
-        print('==============')
+    old_reports = load_report(oldest_file, display_report=False, isins=isin_compare)
+    new_reports = load_report(newer_file, display_report=False, isins=isin_compare)
+
+    renderer = render.Renderer(output_format, separated=True)
     for _isin in isin_compare:
-        if is_html:
-            print('<div><ul>')
         if _isin not in old_reports or _isin not in new_reports:
             continue
         old_report = old_reports[_isin]
         new_report = new_reports[_isin]
-        print(f'{html_tag["h3_in"]}{new_report["DISPLAY_NAME"]["v"]} ({new_report["isin"]}){html_tag["h3_out"]}')
+        renderer.section(f'{new_report["DISPLAY_NAME"]["v"]} ({new_report["isin"]})',
+            as_list=True, isin=_isin)
 
-        report_valorisation(old_report, new_report, html_tag)
+        report_valorisation(old_report, new_report, renderer)
 
-        report_per(old_report, new_report, html_tag)
+        report_per(old_report, new_report, renderer)
 
-        report_peg(old_report, new_report, html_tag)
+        report_peg(old_report, new_report, renderer)
 
-        if is_html:
-            print('</ul></div>')
-        else:
-            print('==============')
-    if is_html:
-        print('</body></html>')
+    renderer.write()
 
 
-def get_negative_values(oldest_file, newer_file, isin_compare):
+def get_float(report, field):
+    """
+    Returns the value of the field as a float, None when missing or not a number
+    """
+    if report is None or field not in report:
+        return None
+    value = report[field]
+    if isinstance(value, dict):
+        value = value.get('v')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def load_columns(report_files, isin_compare, fields):
+    """
+    Returns the values of each field for each ISIN over the report files (None when missing),
+    each file being loaded once, and the last report of each ISIN
+    """
+    columns = {field: {_isin: [] for _isin in isin_compare} for field in fields}
+    last_reports = {}
+    for report_file in report_files:
+        reports = load_report(report_file, display_report=False, isins=isin_compare)
+        last_reports.update(reports)
+        for field in fields:
+            for _isin in isin_compare:
+                columns[field][_isin].append(get_float(reports.get(_isin), field))
+    return columns, last_reports
+
+def load_prices(report_files, isin_compare):
     """
-    Check for negative valorisation and return corresponding ISINs
+    Returns the LVAL_NORM of each ISIN over the report files (None when missing),
+    each file being loaded once, and the last report of each ISIN
     """
-    old_reports = load_report(oldest_file, display_report=False)
-    new_reports = load_report(newer_file, display_report=False)
+    columns, last_reports = load_columns(report_files, isin_compare, ['LVAL_NORM'])
+    return columns['LVAL_NORM'], last_reports
 
-    negative_valorisation_isins = []
-    equal_valorisation_isins = []
+def get_down_streak(prices):
+    """
+    Returns the number of down days of the run ending on the last day, unchanged days
+    not breaking it, and the index of the first down day (None if never down)
+    """
+    streak = 0
+    first_down = None
+    for index, (old_price, new_price) in enumerate(zip(prices, prices[1:])):
+        if old_price is None or new_price is None or new_price > old_price:
+            streak = 0
+        elif new_price < old_price:
+            streak += 1
+            if first_down is None:
+                first_down = index
+    return streak, first_down
+
+
+def diff3_report(directory, isin_compare, output_format='text', days=7, min_streak=3):
+    """
+    Report the ISIN down for at least min_streak days in a row over the last days
+    """
+    # Get a list of all report files in the directory, sorted by date
+    report_files = sorted(glob.glob(os.path.join(directory, '*.txt')))
 
-    for _isin in isin_compare:
-        if _isin not in old_reports or _isin not in new_reports:
-            continue
-        old_report = old_reports[_isin]
-        new_report = new_reports[_isin]
+    # Take only the last days
+    report_files = report_files[-days:]
+    prices, last_report = load_prices(report_files, isin_compare)
 
-        # Check if 'LVAL_NORM' is in report and if its value is less than 0
-        if 'LVAL_NORM' in new_report and new_report['LVAL_NORM']['v'] is not None:
-            if float(new_report['LVAL_NORM']['v']) - float(old_report['LVAL_NORM']['v']) < 0:
-                negative_valorisation_isins.append(new_report['isin'])
-            if float(new_report['LVAL_NORM']['v']) == float(old_report['LVAL_NORM']['v']):
-                equal_valorisation_isins.append(new_report['isin'])
+    streaks = []
+    for position, _isin in enumerate(isin_compare):
+        streak, first_down = get_down_streak(prices[_isin])
+        if streak >= min_streak:
+            streaks.append((first_down, position, _isin, streak))
 
-    return negative_valorisation_isins, equal_valorisation_isins
+    renderer = render.Renderer(output_format)
+    for _, _, _isin, streak in sorted(streaks):
+        renderer.section(f'{last_report[_isin]["DISPLAY_NAME"]["v"]}: {streak} days in a row !',
+            isin=_isin, streak=streak)
+    renderer.write()
 
 
-def diff3_report(directory, isin_compare, is_html):
+# (label, field, True for a change in % or False for a difference)
+MATRIX_METRICS = [
+    ('Evolution valorisation (%)', 'LVAL_NORM', True),
+    ('Evolution PER', 'PER_ANNEE_ESTIMEE', False),
+    ('Evolution PEG', 'CUSTOM_PEG', False),
+]
+
+def get_change(old_value, new_value, percent):
     """
-    Compare two report
+    Returns the change from the old value to the new one, None if not computable
     """
-    html_tag = {
-        'bold_in': '',
-        'bold_out': '',
-        'h3_in': '',
-        'h3_out': '',
-        'li_in': '',
-        'li_out': '',
-        'red_in': '',
-        'red_out': '',
-        'green_in': '',
-        'green_out': '',
-        'blue_in': '',
-        'blue_out': '',
-    }
-    if is_html:
-        html_tag = {
-            'bold_in': '<b>',
-            'bold_out': '</b>',
-            'h3_in': '<h3>',
-            'h3_out': '</h3>',
-            'li_in': '<li>',
-            'li_out': '</li>',
-            'red_in': '<span style="color: #f00;">',
-            'red_out': '</span>',
-            'green_in': '<span style="color: #18b724;">',
-            'green_out': '</span>',
-            'blue_in': '<span style="color: #007eff;">',
-            'blue_out': '</span>',
-        }
-
-    # Get a list of all report files in the directory, sorted by creation time
-    report_files = sorted(glob.glob(os.path.join(directory, '*.txt')))
+    if old_value is None or new_value is None or (percent and old_value == 0):
+        return None
+    if percent:
+        return round(100 * (new_value / old_value - 1), 2)
+    return round(new_value - old_value, 1)
 
-    # Take only the last 7 files
-    report_files = report_files[-7:]
-    last_report = load_report(report_files[-1], display_report=False)
-
-    count_negative_isins = {}
-    for i in range(len(report_files) - 1):
-        negative_isins, equal_isins = get_negative_values(report_files[i], report_files[i+1], isin_compare)
-
-        # Initialize isin in negative_isins
-        for _isin in negative_isins:
-            if _isin not in count_negative_isins:
-                count_negative_isins[_isin] = 0
-
-        # Update count
-        for _isin in count_negative_isins:
-            if _isin in negative_isins:
-                count_negative_isins[_isin] += 1
-            elif _isin not in equal_isins:
-                count_negative_isins[_isin] = 0
+def get_changes(values, percent):
+    """
+    Returns the change of each day from the previous one, then the change
+    from the first valid value to the last one
+    """
+    changes = [get_change(old_value, new_value, percent)
+        for old_value, new_value in zip(values, values[1:])]
+    valid = [value for value in values if value is not None]
+    changes.append(get_change(valid[0], valid[-1], percent) if len(valid) > 1 else None)
+    return changes
 
-    if is_html:
-        print('<html><body>')
+def diff_matrix_report(directory, isin_compare, output_format='text', days=7, start='', end=''):
+    """
+    Report the day to day changes of each ISIN over the last days, or between
+    the start and end dates (YYYY_MM_DD) included, as one matrix
+    """
+    report_files = sorted(Path(directory).glob('*.txt'))
+    if start or end:
+        report_files = [path for path in report_files \
+            if (not start or path.stem >= start) and (not end or path.stem <= end)]
+    else:
+        report_files = report_files[-days:]
+    if len(report_files) < 2:
+        print(f'Not enough reports to compare in {directory}...')
+        sys.exit(1)
+    fields = [field for _, field, _ in MATRIX_METRICS]
+    columns, last_reports = load_columns(report_files, isin_compare, fields)
 
-    for _isin in count_negative_isins:
-        if count_negative_isins[_isin] >= 3:
-            print(f'{html_tag["h3_in"]}{last_report[_isin]["DISPLAY_NAME"]["v"]}: {count_negative_isins[_isin]} days in a row !{html_tag["h3_out"]}')
-    if is_html:
-        print('</body></html>')
+    rows = []
+    for _isin in isin_compare:
+        name = _isin
+        if _isin in last_reports and 'DISPLAY_NAME' in last_reports[_isin]:
+            name = f'{last_reports[_isin]["DISPLAY_NAME"]["v"]} ({_isin})'
+        for label, field, percent in MATRIX_METRICS:
+            changes = get_changes(columns[field][_isin], percent)
+            if all(change is None for change in changes):
+                continue
+            rows.append([name, label] + ['' if change is None else \
+                f'{get_sign(change)}{change}' for change in changes])
+            name = ''
+    renderer = render.Renderer(output_format)
+    renderer.section(f'{report_files[0].stem} -> {report_files[-1].stem}')
+    renderer.table(['Nom', 'Evolution'] + [path.stem for path in report_files[1:]] + ['Total'],
+        rows)
+    renderer.write()
 
 
 if __name__ == '__main__':
@@ -300,12 +417,22 @@ if __name__ == '__main__':
         help='Save command')
     SAVE_PARSER.add_argument('-o', '--output-dir', action='store',\
         help='Save report into the specified directory', default='')
+    SAVE_PARSER.add_argument('-w', '--workers', action='store', type=int,\
+        help='Number of ISIN fetched at the same time', default=1)
+    SAVE_PARSER.add_argument('--history', action='store_true',\
+        help='Also save into the columnar history of the output directory', default=False)
+    SAVE_PARSER.add_argument('--delta', action='store_true',\
+        help='Only save the changes since the last full snapshot', default=False)
+    SAVE_PARSER.add_argument('-k', '--keyframe-interval', action='store', type=int,\
+        help='With --delta, save a full snapshot every N days (=7)', default=7)
 
     # LOAD Arguments
     LOAD_PARSER = SUBPARSERS.add_parser('load',\
         help='Load command')
     LOAD_PARSER.add_argument('inputfile', action='store',\
         help='Load and display a saved report')
+    LOAD_PARSER.add_argument('-i', '--isin', action='append',\
+        help='ISIN to display (=all), can be repeated', default=[])
 
     # DIFF Arguments
     DIFF_PARSER = SUBPARSERS.add_parser('diff',\
@@ -317,7 +444,9 @@ if __name__ == '__main__':
     DIFF_PARSER.add_argument('-i', '--isin', action='store',\
         help='Specific ISIN to compare', default='')
     DIFF_PARSER.add_argument('--html', action='store_true',\
-        help='Output in HTML format', default=False)
+        help='Output in HTML format, same as --format html', default=False)
+    DIFF_PARSER.add_argument('--format', action='store', choices=render.FORMATS,\
+        help='Output format (=text)', default='text')
 
     # DIFF3 Arguments
     DIFF3_PARSER = SUBPARSERS.add_parser('diff3',\
@@ -325,7 +454,61 @@ if __name__ == '__main__':
     DIFF3_PARSER.add_argument('directory', action='store',\
         help='Directory with reports for comparison')
     DIFF3_PARSER.add_argument('--html', action='store_true',\
-        help='Output in HTML format', default=False)
+        help='Output in HTML format, same as --format html', default=False)
+    DIFF3_PARSER.add_argument('--format', action='store', choices=render.FORMATS,\
+        help='Output format (=text)', default='text')
+    DIFF3_PARSER.add_argument('-d', '--days', action='store', type=int,\
+        help='Number of last reports to analyse (=7)', default=7)
+    DIFF3_PARSER.add_argument('-k', '--min-streak', action='store', type=int,\
+        help='Minimum number of down days in a row (=3)', default=3)
+
+    # MATRIX Arguments
+    MATRIX_PARSER = SUBPARSERS.add_parser('matrix',\
+        help='Diff matrix command')
+    MATRIX_PARSER.add_argument('directory', action='store',\
+        help='Directory with reports for comparison')
+    MATRIX_PARSER.add_argument('--html', action='store_true',\
+        help='Output in HTML format, same as --format html', default=False)
+    MATRIX_PARSER.add_argument('--format', action='store', choices=render.FORMATS,\
+        help='Output format (=text)', default='text')
+    MATRIX_PARSER.add_argument('-d', '--days', action='store', type=int,\
+        help='Number of last reports to compare (=7)', default=7)
+    MATRIX_PARSER.add_argument('--start', action='store',\
+        help='First date to compare, YYYY_MM_DD (instead of --days)', default='')
+    MATRIX_PARSER.add_argument('--end', action='store',\
+        help='Last date to compare, YYYY_MM_DD (instead of --days)', default='')
+    MATRIX_PARSER.add_argument('-i', '--isin', action='append',\
+        help='ISIN to compare (=ISIN_COMPARE), can be repeated', default=[])
+
+    # SCREEN Arguments
+    SCREEN_PARSER = SUBPARSERS.add_parser('screen',\
+        help='Screen command')
+    SCREEN_PARSER.add_argument('path', action='store',\
+        help='Saved report, or directory of the last one')
+    SCREEN_PARSER.add_argument('query', action='store',\
+        help="Query: 'FIELD OP NUMBER [and ...] [sort FIELD [asc|desc]] [top N]', OP in < <= > >= == !=")
+    SCREEN_PARSER.add_argument('-f', '--field', action='append',\
+        help='Other field to display, can be repeated', default=[])
+
+    # HISTORY Arguments
+    HISTORY_PARSER = SUBPARSERS.add_parser('history',\
+        help='History command')
+    HISTORY_PARSER.add_argument('action', action='store', choices=['import', 'show', 'indicators'],\
+        help='Import the daily reports into the history, show a field or the indicators')
+    HISTORY_PARSER.add_argument('directory', action='store',\
+        help='Directory with the daily reports')
+    HISTORY_PARSER.add_argument('-f', '--field', action='store',\
+        help='Field to show', default='LVAL_NORM')
+    HISTORY_PARSER.add_argument('-i', '--isin', action='append',\
+        help='ISIN to show (=all), can be repeated', default=[])
+    HISTORY_PARSER.add_argument('-d', '--days', action='store', type=int,\
+        help='Number of last days to show (=all)', default=0)
+    HISTORY_PARSER.add_argument('--mm', action='append', type=int,\
+        help='Moving average window in days, can be repeated (=last ones, 20 50 100)', default=[])
+    HISTORY_PARSER.add_argument('--rsi', action='store', type=int,\
+        help='RSI period in days (=last one, 14)', default=None)
+    HISTORY_PARSER.add_argument('--volatility', action='store', type=int,\
+        help='Volatility window in days (=last one, 20)', default=None)
 
     ARGS = PARSER.parse_args()
 
@@ -334,15 +517,39 @@ if __name__ == '__main__':
         sys.exit(1)
 
     if sys.argv[1] == 'save':
-        save_report(ARGS.output_dir)
+        save_report(ARGS.output_dir, workers=ARGS.workers, save_history=ARGS.history,
+            keyframe_interval=ARGS.keyframe_interval if ARGS.delta else 0)
     elif sys.argv[1] == 'load':
-        load_report(ARGS.inputfile)
+        load_report(ARGS.inputfile, isins=ARGS.isin or None)
     elif sys.argv[1] == 'diff':
         ISIN_COMPARE = settings.ISIN_COMPARE
         if ARGS.isin:
             ISIN_COMPARE = [ARGS.isin]
-        diff_report(ARGS.oldest_file, ARGS.newer_file, ISIN_COMPARE, ARGS.html)
+        diff_report(ARGS.oldest_file, ARGS.newer_file, ISIN_COMPARE,
+            'html' if ARGS.html else ARGS.format)
     elif sys.argv[1] == 'diff3':
-        diff3_report(ARGS.directory, settings.ISIN_COMPARE, ARGS.html)
+        diff3_report(ARGS.directory, settings.ISIN_COMPARE, 'html' if ARGS.html else ARGS.format,
+            days=ARGS.days, min_streak=ARGS.min_streak)
+    elif sys.argv[1] == 'matrix':
+        diff_matrix_report(ARGS.directory, ARGS.isin or settings.ISIN_COMPARE,
+            'html' if ARGS.html else ARGS.format,
+            days=ARGS.days, start=ARGS.start, end=ARGS.end)
+    elif sys.argv[1] == 'screen':
+        screen_report(ARGS.path, ARGS.query, ARGS.field)
+    elif sys.argv[1] == 'history':
+        if ARGS.action == 'import':
+            print(f'{history.import_daily_files(ARGS.directory)} days imported')
+            indicators.update(Path(ARGS.directory) / 'history')
+        elif ARGS.action == 'indicators':
+            WINDOWS = None
+            if ARGS.mm or ARGS.rsi or ARGS.volatility:
+                WINDOWS = {
+                    'mm': ARGS.mm or indicators.DEFAULT_WINDOWS['mm'],
+                    'rsi': ARGS.rsi or indicators.DEFAULT_WINDOWS['rsi'],
+                    'volatility': ARGS.volatility or indicators.DEFAULT_WINDOWS['volatility'],
+                }
+            show_indicators(ARGS.directory, ARGS.isin, WINDOWS)
+        else:
+            show_history(ARGS.directory, ARGS.field, ARGS.isin, ARGS.days)
 
     sys.exit(0)